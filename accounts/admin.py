@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.utils import timezone
+from django.db import IntegrityError, transaction
 from .models import InvitationCode, UserProfile
 
 @admin.register(InvitationCode)
@@ -8,13 +9,29 @@ class InvitationCodeAdmin(admin.ModelAdmin):
     list_filter = ('is_used', 'created_at')
     search_fields = ('code', 'used_by__username', 'created_by__username')
     readonly_fields = ('created_at',)
+    list_select_related = ('used_by', 'created_by')  # 列表页一次JOIN取出关联用户，避免N+1查询
     
     def save_model(self, request, obj, form, change):
+        generated = False
         if not obj.pk:  # 如果是新创建的邀请码
             obj.created_by = request.user
             if not obj.code:  # 如果没有手动设置邀请码
                 obj.code = InvitationCode.generate_code()
-        super().save_model(request, obj, form, change)
+                generated = True
+
+        if generated:
+            # 依赖code字段的唯一约束处理冲突：插入失败时重新生成，无需事先查询
+            for attempt in range(5):
+                try:
+                    with transaction.atomic():
+                        super().save_model(request, obj, form, change)
+                    break
+                except IntegrityError:
+                    if attempt == 4:
+                        raise
+                    obj.code = InvitationCode.generate_code()
+        else:
+            super().save_model(request, obj, form, change)
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -22,3 +39,4 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)
     search_fields = ('user__username', 'last_login_ip')
     readonly_fields = ('created_at', 'updated_at', 'login_count')
+    list_select_related = ('user',)
@@ -0,0 +1,60 @@
+from django.contrib.auth import get_user_model  # 获取当前用户模型
+from django.conf import settings  # 项目配置
+from django.contrib.auth.backends import ModelBackend  # Django默认认证后端
+from django.core.cache import cache  # Django缓存框架
+from .models import USER_CACHE_TIMEOUT, user_cache_key
+
+UserModel = get_user_model()
+
+class ProfileJoinBackend(ModelBackend):
+    """认证后端
+    在查询用户时通过JOIN一并取出用户配置和邀请码，
+    登录视图访问user.profile时无需再次查询数据库；
+    后续请求中的用户对象从缓存读取
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        """验证用户名和密码，返回已预加载配置信息的用户"""
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            # 登录流程只读取邀请码的过期时间，其余配置列延迟加载
+            user = UserModel._default_manager.select_related(
+                'profile__invitation_code'
+            ).defer(
+                'profile__last_login_ip',
+                'profile__login_count',
+                'profile__created_at',
+                'profile__updated_at',
+                'profile__invitation_code__code',
+                'profile__invitation_code__created_at',
+                'profile__invitation_code__is_used',
+                'profile__invitation_code__used_by',
+                'profile__invitation_code__created_by',
+            ).get(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            # 与ModelBackend一致：执行一次密码哈希，缩小存在/不存在用户的耗时差异
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        """按会话中的用户ID获取用户，同时预加载用户配置
+        使用共享缓存时结果写入缓存，用户或配置变更时由信号清除；
+        进程内缓存无法通知其他工作进程，修改密码或停用账号后会继续使用过期的用户，
+        因此只在共享缓存下缓存用户
+        """
+        key = user_cache_key(user_id)
+        user = cache.get(key) if settings.CACHE_SHARED else None
+        if user is None:
+            try:
+                user = UserModel._default_manager.select_related('profile').get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            if settings.CACHE_SHARED:
+                cache.set(key, user, USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
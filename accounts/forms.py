@@ -1,8 +1,13 @@
 from django import forms
+from django.contrib.auth import password_validation  # 密码校验规则
 from django.contrib.auth.forms import UserCreationForm  # Django内置的用户创建表单
 from django.contrib.auth.models import User
+from django.core.cache import cache  # Django缓存框架
 from .models import InvitationCode
 
+# 无效邀请码校验结果的缓存时间（秒）
+INVITATION_CACHE_TIMEOUT = 30
+
 class LoginForm(forms.Form):
     """登录表单
     处理用户登录的表单，包含用户名、密码和记住我选项
@@ -54,38 +59,67 @@ class RegisterForm(UserCreationForm):
         })
     )
 
+    # 密码字段，在类定义中直接声明Bootstrap样式，无需在实例化时逐个修改控件
+    password1 = forms.CharField(
+        label='密码',
+        strip=False,
+        widget=forms.PasswordInput(attrs={
+            'class': 'form-control',
+            'autocomplete': 'new-password'
+        }),
+        help_text=password_validation.password_validators_help_text_html(),
+    )
+    # 确认密码字段，使用Bootstrap样式
+    password2 = forms.CharField(
+        label='确认密码',
+        strip=False,
+        widget=forms.PasswordInput(attrs={
+            'class': 'form-control',
+            'autocomplete': 'new-password'
+        }),
+        help_text='请再次输入密码进行确认',
+    )
+
     class Meta:
         model = User
         fields = ('username', 'email', 'password1', 'password2', 'invitation_code')
-
-    def __init__(self, *args, **kwargs):
-        """初始化表单
-        为所有输入字段添加Bootstrap样式
-        """
-        super().__init__(*args, **kwargs)
-        # 为所有文本输入字段添加Bootstrap类
-        for field in self.fields.values():
-            if isinstance(field.widget, (forms.TextInput, forms.EmailInput, forms.PasswordInput)):
-                field.widget.attrs.update({'class': 'form-control'})
+        widgets = {
+            'username': forms.TextInput(attrs={
+                'class': 'form-control',
+                'placeholder': '请输入用户名'
+            }),
+        }
 
     def clean_invitation_code(self):
         """验证邀请码
-        检查邀请码是否存在且有效
+        检查邀请码是否存在且有效，验证通过后将实例保存在self.invitation
+        无效的邀请码会被短时间缓存，重复提交时不再查询数据库
         """
         code = self.cleaned_data.get('invitation_code')
+        key = InvitationCode.cache_key(code)
+        cached = cache.get(key)
+        if cached == 'invalid':
+            raise forms.ValidationError('邀请码已失效')
+        if cached == 'missing':
+            raise forms.ValidationError('无效的邀请码')
+
         try:
             invitation = InvitationCode.objects.get(code=code)
-            if not invitation.is_valid():
-                raise forms.ValidationError('邀请码已失效')
         except InvitationCode.DoesNotExist:
+            cache.set(key, 'missing', INVITATION_CACHE_TIMEOUT)
             raise forms.ValidationError('无效的邀请码')
+        if not invitation.is_valid():
+            cache.set(key, 'invalid', INVITATION_CACHE_TIMEOUT)
+            raise forms.ValidationError('邀请码已失效')
+        # 缓存查询到的邀请码实例，供视图直接复用
+        self.invitation = invitation
         return code
 
     def clean_email(self):
         """验证邮箱
-        检查邮箱是否已被其他用户使用
+        检查邮箱是否已被其他用户使用（不区分大小写，可命中auth_user上的UPPER(email)索引）
         """
         email = self.cleaned_data.get('email')
-        if User.objects.filter(email=email).exists():
+        if User.objects.filter(email__iexact=email).exists():
             raise forms.ValidationError('该邮箱已被注册')
         return email 
\ No newline at end of file
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY 不能在事务中执行
+    atomic = False
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("accounts", "0001_initial"),
+    ]
+
+    operations = [
+        # 为注册时的邮箱查重（email__iexact）建立函数索引
+        # Django在PostgreSQL上将iexact编译为 UPPER("email") = UPPER(%s)
+        # 不使用唯一约束：已有的管理员账号可能共享空邮箱
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS auth_user_email_upper_idx ON auth_user (UPPER(email));',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS auth_user_email_upper_idx;',
+        ),
+    ]
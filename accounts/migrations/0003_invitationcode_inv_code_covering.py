@@ -0,0 +1,21 @@
+# Generated by Django 4.2.19 on 2026-10-15 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_auth_user_email_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invitationcode",
+            index=models.Index(
+                fields=["code"],
+                include=("is_used", "expires_at"),
+                name="inv_code_covering",
+            ),
+        ),
+    ]
@@ -1,7 +1,18 @@
 from django.db import models
 from django.contrib.auth.models import User  # Django内置的用户模型
+from django.db.models.signals import post_save, post_delete  # 模型保存/删除信号
+from django.core.cache import cache  # Django缓存框架
+from django.dispatch import receiver  # 信号接收器装饰器
 from django.utils import timezone  # 用于处理时间
-import uuid  # 用于生成唯一标识符
+import secrets  # 用于生成安全随机数
+
+# 已认证用户（含用户配置）在缓存中的保存时间（秒）
+# update()等不触发信号的写入（如批量停用账号）最多在该时间后生效，因此保持较短
+USER_CACHE_TIMEOUT = 60
+
+def user_cache_key(user_id):
+    """返回已认证用户在缓存中的键"""
+    return f'auth_user:{user_id}'
 
 class InvitationCode(models.Model):
     """邀请码模型
@@ -35,6 +46,14 @@ class InvitationCode(models.Model):
         verbose_name = '邀请码'  # 模型在管理界面的显示名称
         verbose_name_plural = verbose_name  # 复数形式
         ordering = ['-created_at']  # 按创建时间倒序排序
+        indexes = [
+            # 覆盖索引：按邀请码查询时直接从索引读取使用状态和过期时间
+            models.Index(
+                fields=['code'],
+                include=['is_used', 'expires_at'],
+                name='inv_code_covering'
+            ),
+        ]
 
     def __str__(self):
         """返回邀请码的字符串表示"""
@@ -43,9 +62,14 @@ class InvitationCode(models.Model):
     @classmethod
     def generate_code(cls):
         """生成唯一的邀请码
-        使用UUID生成8位大写字母数字组合
+        使用4字节安全随机数生成8位大写十六进制字符串
         """
-        return str(uuid.uuid4())[:8].upper()
+        return secrets.token_hex(4).upper()
+
+    @staticmethod
+    def cache_key(code):
+        """返回邀请码校验结果在缓存中的键"""
+        return f'inv:{code}'
 
     def is_valid(self):
         """检查邀请码是否有效
@@ -90,4 +114,22 @@ class UserProfile(models.Model):
 
     def __str__(self):
         """返回用户配置的字符串表示"""
-        return f"{self.user.username}的配置" 
\ No newline at end of file
+        return f"{self.user.username}的配置"
+
+@receiver(post_save, sender=User)
+def ensure_profile(sender, instance, created, **kwargs):
+    """创建用户时自动创建对应的用户配置，保证每个用户都有配置记录"""
+    if created:
+        UserProfile.objects.get_or_create(user=instance)
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """用户或用户配置变更时清除认证缓存，避免使用过期的用户信息"""
+    user_id = instance.pk if sender is User else instance.user_id
+    cache.delete(user_cache_key(user_id))
+
+@receiver([post_save, post_delete], sender=InvitationCode)
+def invalidate_invitation_cache(sender, instance, **kwargs):
+    """邀请码新建、修改或删除时清除其校验缓存，使变更立即生效（不论通过后台、shell还是迁移写入）"""
+    cache.delete(InvitationCode.cache_key(instance.code))
@@ -1,3 +1,99 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from .backends import ProfileJoinBackend
+from .forms import RegisterForm
+from .models import InvitationCode, UserProfile, user_cache_key
 
-# Create your tests here.
+# 测试用的合法密码（满足默认密码校验规则）
+TEST_PASSWORD = 'S3cure-Passw0rd!'
+
+class RegisterFormInvitationTests(TestCase):
+    """注册表单邀请码校验测试"""
+
+    def setUp(self):
+        cache.clear()
+
+    def _form(self, code):
+        return RegisterForm(data={
+            'username': 'alice',
+            'email': 'alice@example.com',
+            'password1': TEST_PASSWORD,
+            'password2': TEST_PASSWORD,
+            'invitation_code': code,
+        })
+
+    def test_valid_code(self):
+        InvitationCode.objects.create(code='ABCD1234')
+        form = self._form('ABCD1234')
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.invitation.code, 'ABCD1234')
+
+    def test_missing_code(self):
+        form = self._form('NOPE0000')
+        self.assertFalse(form.is_valid())
+        self.assertIn('invitation_code', form.errors)
+
+    def test_used_code(self):
+        InvitationCode.objects.create(code='USED0000', is_used=True)
+        form = self._form('USED0000')
+        self.assertFalse(form.is_valid())
+        self.assertIn('invitation_code', form.errors)
+
+    def test_code_created_after_rejection_is_accepted(self):
+        """被拒绝的邀请码在创建后立即可用，不受校验缓存影响"""
+        self.assertFalse(self._form('LATE0000').is_valid())
+        InvitationCode.objects.create(code='LATE0000')
+        self.assertTrue(self._form('LATE0000').is_valid())
+
+    def test_code_marked_used_is_rejected(self):
+        """邀请码被标记为已使用后立即失效"""
+        invitation = InvitationCode.objects.create(code='ONCE0000')
+        self.assertTrue(self._form('ONCE0000').is_valid())
+        invitation.is_used = True
+        invitation.save()
+        self.assertFalse(self._form('ONCE0000').is_valid())
+
+class UserCacheTests(TestCase):
+    """已认证用户缓存测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('bob', 'bob@example.com', TEST_PASSWORD)
+
+    def _deactivate_and_request(self):
+        self.client.force_login(self.user)
+        ProfileJoinBackend().get_user(self.user.pk)  # 预先加载（共享缓存下写入缓存）
+        self.user.is_active = False
+        self.user.save()
+        return self.client.get(reverse('accounts:profile'))
+
+    def test_deactivated_user_rejected_on_next_request(self):
+        response = self._deactivate_and_request()
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('accounts:login'), response['Location'])
+
+    @override_settings(CACHE_SHARED=True)
+    def test_deactivated_user_rejected_with_shared_cache(self):
+        response = self._deactivate_and_request()
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('accounts:login'), response['Location'])
+
+    def test_update_deactivation_not_cached_without_shared_cache(self):
+        """进程内缓存下不缓存用户，update()停用账号立即生效"""
+        backend = ProfileJoinBackend()
+        self.assertIsNotNone(backend.get_user(self.user.pk))
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(backend.get_user(self.user.pk))
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+    @override_settings(CACHE_SHARED=True)
+    def test_profile_save_clears_cached_user(self):
+        backend = ProfileJoinBackend()
+        backend.get_user(self.user.pk)
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+        profile = UserProfile.objects.get(user=self.user)
+        profile.login_count = 5
+        profile.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
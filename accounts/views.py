@@ -3,8 +3,11 @@ from django.contrib.auth import login, logout, authenticate  # 用户认证相
 from django.contrib.auth.decorators import login_required  # 登录要求装饰器
 from django.contrib import messages  # 消息框架
 from django.utils import timezone  # 时区工具
+from django.core.cache import cache  # Django缓存框架
+from django.db import transaction  # 数据库事务
+from django.db.models import F  # 数据库字段表达式
 from .forms import LoginForm, RegisterForm  # 导入表单类
-from .models import InvitationCode, UserProfile  # 导入模型
+from .models import InvitationCode, UserProfile, user_cache_key  # 导入模型
 import logging  # 日志模块
 
 # 获取logger实例
@@ -38,31 +41,35 @@ def login_view(request):
                     messages.success(request, f'欢迎回来，{username}！')
                     return redirect('geodata:map')
                 
+                # 获取用户配置（已由ProfileJoinBackend在认证时一并加载）
+                profile = getattr(user, 'profile', None)
+                if profile is None:
+                    # 信号机制上线前创建的历史用户可能缺少配置，按需补建
+                    profile, _ = UserProfile.objects.get_or_create(user=user)
+
                 # 检查邀请码状态
-                try:
-                    profile = UserProfile.objects.get(user=user)
-                    if profile.invitation_code and profile.invitation_code.expires_at:
-                        if profile.invitation_code.expires_at < timezone.now():
-                            messages.error(request, '您的账号已过期，请联系管理员')
-                            return render(request, 'accounts/login.html', {'form': form})
-                    
-                    # 登录用户
-                    login(request, user)
-                    
-                    # 更新用户配置信息
-                    profile.last_login_ip = request.META.get('REMOTE_ADDR')
-                    profile.login_count += 1
-                    profile.save()
-                    
-                    # 设置会话过期时间
-                    if not remember_me:
-                        request.session.set_expiry(0)  # 浏览器关闭即过期
-                    
-                    messages.success(request, f'欢迎回来，{username}！')
-                    return redirect('geodata:map')
-                except UserProfile.DoesNotExist:
-                    messages.error(request, '用户配置信息不存在')
-                    return render(request, 'accounts/login.html', {'form': form})
+                if profile.invitation_code and profile.invitation_code.expires_at:
+                    if profile.invitation_code.expires_at < timezone.now():
+                        messages.error(request, '您的账号已过期，请联系管理员')
+                        return render(request, 'accounts/login.html', {'form': form})
+                
+                # 登录用户
+                login(request, user)
+                
+                # 更新用户配置信息（单条UPDATE，登录次数在数据库端自增）
+                UserProfile.objects.filter(pk=profile.pk).update(
+                    last_login_ip=request.META.get('REMOTE_ADDR'),
+                    login_count=F('login_count') + 1
+                )
+                # update()不触发信号，手动清除认证缓存
+                cache.delete(user_cache_key(user.pk))
+                
+                # 设置会话过期时间
+                if not remember_me:
+                    request.session.set_expiry(0)  # 浏览器关闭即过期
+                
+                messages.success(request, f'欢迎回来，{username}！')
+                return redirect('geodata:map')
             else:
                 messages.error(request, '用户名或密码错误')
     else:
@@ -85,27 +92,27 @@ def register_view(request):
     if request.method == 'POST':
         form = RegisterForm(request.POST)
         if form.is_valid():
-            # 获取并验证邀请码
-            invitation_code = InvitationCode.objects.get(
-                code=form.cleaned_data['invitation_code']
-            )
-            
-            # 创建用户
-            user = form.save(commit=False)
-            user.email = form.cleaned_data['email']
-            user.save()
+            # 复用表单验证时已获取的邀请码
+            invitation_code = form.invitation
             
-            # 创建用户配置文件
-            UserProfile.objects.create(
-                user=user,
-                invitation_code=invitation_code,
-                last_login_ip=request.META.get('REMOTE_ADDR')
-            )
-            
-            # 标记邀请码为已使用
-            invitation_code.is_used = True
-            invitation_code.used_by = user
-            invitation_code.save()
+            with transaction.atomic():
+                # 创建用户
+                user = form.save(commit=False)
+                user.email = form.cleaned_data['email']
+                user.save()
+                
+                # 补充用户配置文件（配置记录已由post_save信号创建）
+                UserProfile.objects.filter(user=user).update(
+                    invitation_code=invitation_code,
+                    last_login_ip=request.META.get('REMOTE_ADDR')
+                )
+                
+                # 标记邀请码为已使用（仅更新变化的字段）
+                InvitationCode.objects.filter(pk=invitation_code.pk).update(
+                    is_used=True,
+                    used_by=user
+                )
+            cache.delete(InvitationCode.cache_key(invitation_code.code))
             
             # 自动登录
             login(request, user)
@@ -207,14 +207,52 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# 瓦片设置
+# 设置GEODATA_DYNAMIC_TILES=1时，入库只生成Cloud-Optimized GeoTIFF，瓦片按请求动态渲染；
+# 否则使用gdal2tiles预生成PNG瓦片金字塔
+GEODATA_DYNAMIC_TILES = os.environ.get('GEODATA_DYNAMIC_TILES') == '1'
+TILE_COG_DIR = os.path.join(MEDIA_ROOT, 'tile_cogs')
+
+# 文件下载设置
+# 部署在Nginx/Apache之后时，下载视图只返回内部重定向头，由前端服务器用sendfile发送文件：
+# GEODATA_SENDFILE=nginx 使用X-Accel-Redirect（需将SENDFILE_INTERNAL_URL配置为指向MEDIA_ROOT的internal location），
+# GEODATA_SENDFILE=apache 使用X-Sendfile（需启用mod_xsendfile）；未设置时由Django直接返回文件
+GEODATA_SENDFILE = os.environ.get('GEODATA_SENDFILE', '')
+SENDFILE_INTERNAL_URL = os.environ.get('SENDFILE_INTERNAL_URL', '/protected-media/')
+
 # 认证设置
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.ProfileJoinBackend',  # 认证时一并加载用户配置和邀请码
+]
 LOGIN_URL = 'accounts:login'  # 登录页面的URL
 LOGIN_REDIRECT_URL = 'map'   # 登录成功后的重定向URL
 LOGOUT_REDIRECT_URL = 'accounts:login'  # 登出后的重定向URL
 
+# 缓存设置
+# 配置REDIS_URL环境变量时使用Redis（多进程共享），否则使用进程内缓存
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# 缓存是否在多个Web工作进程间共享；进程内缓存中的失效通知只对当前进程生效，
+# 依赖跨进程失效的缓存（如已认证用户）仅在共享缓存下启用
+CACHE_SHARED = bool(REDIS_URL)
+
 # 会话设置
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'  # 会话数据签名后存入Cookie，不读写数据库
 SESSION_COOKIE_AGE = 1209600  # 两周
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # 浏览器关闭后不过期
 
 # 消息框架设置
-MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'  # 消息存入Cookie，避免额外的会话写入
@@ -1,45 +1,86 @@
 from django.core.management.base import BaseCommand
-from django.contrib.gis.geos import Polygon
-from geodata.models import EnviData
+from django.contrib.gis.geos import Polygon, Point
+from django.db import connection, transaction
+from django.utils import timezone
+from geodata.models import EnviData, invalidate_geojson_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 批量更新的批次大小
+BATCH_SIZE = 500
+# 进度输出间隔（条）
+PROGRESS_INTERVAL = 100
+
 class Command(BaseCommand):
     help = '修复数据库中GF5影像的坐标顺序'
 
     def handle(self, *args, **options):
-        # 获取所有GF5影像数据
-        gf5_records = EnviData.objects.filter(name__startswith='GF5')
-        count = gf5_records.count()
+        if connection.vendor == 'postgresql':
+            fixed = self._fix_in_database()
+        else:
+            fixed = self._fix_in_python(options['verbosity'])
+
+        # 批量更新不会触发模型信号，手动使地图GeoJSON缓存失效
+        # （进程内缓存下按最近更新时间判断，修复时一并刷新了updated_at）
+        invalidate_geojson_cache()
+
+        logger.info(f'GF5影像坐标修复完成，共 {fixed} 条记录')
+        self.stdout.write(self.style.SUCCESS(f'完成! 共修复 {fixed} 条记录'))
+
+    def _fix_in_database(self):
+        """在PostGIS中用一条UPDATE交换所有GF5影像的经纬度顺序"""
+        table = EnviData._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} '
+                f'SET bounds = ST_FlipCoordinates(bounds), '
+                f'center_point = ST_FlipCoordinates(center_point), '
+                f'updated_at = %s '
+                f'WHERE name LIKE %s',
+                [timezone.now(), 'GF5%']
+            )
+            return cursor.rowcount
+
+    def _fix_in_python(self, verbosity=1):
+        """不支持ST_FlipCoordinates时，流式读取记录并分批更新
+
+        Args:
+            verbosity: 命令输出级别，>=2时逐条输出修复记录
+        """
+        gf5_records = EnviData.objects.filter(
+            name__startswith='GF5'
+        ).only('id', 'name', 'bounds', 'center_point')
         fixed = 0
+        batch = []
+        now = timezone.now()
+
+        with transaction.atomic():
+            for record in gf5_records.iterator(chunk_size=BATCH_SIZE):
+                try:
+                    # 交换每个点的经纬度顺序
+                    fixed_coords = [(y, x) for x, y in record.bounds.coords[0]]
+                    record.bounds = Polygon(fixed_coords)
+                    cp = record.center_point
+                    record.center_point = Point(cp.y, cp.x, srid=cp.srid)
+                    record.updated_at = now
+                    batch.append(record)
+                    if verbosity >= 2:
+                        self.stdout.write(f'已修复记录: {record.name}')
+                    elif (fixed + len(batch)) % PROGRESS_INTERVAL == 0:
+                        self.stdout.write(f'已处理 {fixed + len(batch)} 条记录')
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'修复记录 {record.name} 时出错: {str(e)}'))
+                    logger.error(f'修复记录 {record.name} 时出错: {str(e)}')
+                    continue
+
+                if len(batch) >= BATCH_SIZE:
+                    EnviData.objects.bulk_update(batch, ['bounds', 'center_point', 'updated_at'])
+                    fixed += len(batch)
+                    batch.clear()
+
+            if batch:
+                EnviData.objects.bulk_update(batch, ['bounds', 'center_point', 'updated_at'])
+                fixed += len(batch)
 
-        self.stdout.write(f'找到 {count} 条GF5影像记录需要修复')
-
-        for record in gf5_records:
-            try:
-                # 获取原始边界坐标
-                original_coords = list(record.bounds.coords[0])
-                
-                # 交换每个点的经纬度顺序
-                fixed_coords = [(y, x) for x, y in original_coords]
-                
-                # 创建新的多边形
-                new_bounds = Polygon(fixed_coords)
-                
-                # 更新记录
-                record.bounds = new_bounds
-                record.center_point.x, record.center_point.y = record.center_point.y, record.center_point.x
-                record.save()
-                
-                fixed += 1
-                self.stdout.write(f'已修复记录: {record.name}')
-                logger.info(f'记录 {record.name} 的原始坐标: {original_coords}')
-                logger.info(f'记录 {record.name} 的修复后坐标: {fixed_coords}')
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'修复记录 {record.name} 时出错: {str(e)}'))
-                logger.error(f'修复记录 {record.name} 时出错: {str(e)}')
-                continue
-
-        self.stdout.write(self.style.SUCCESS(f'完成! 共修复 {fixed}/{count} 条记录')) 
\ No newline at end of file
+        return fixed
@@ -2,7 +2,7 @@
 ENVI遥感数据处理命令模块
 
 本模块实现了一个Django管理命令，用于处理ENVI格式的遥感数据。主要功能包括：
-1. 数据格式转换（ENVI -> GeoTIFF）
+1. 数据格式转换（ENVI -> VRT，RPC校正时输出Cloud-Optimized GeoTIFF）
 2. 坐标系转换和校正
 3. 波长信息提取
 4. 缩略图生成
@@ -20,19 +20,551 @@ from django.core.management.base import BaseCommand
 from django.contrib.gis.geos import Polygon, Point
 from django.db import transaction
 from osgeo import gdal, osr
-from datetime import datetime
+try:
+    from osgeo_utils import gdal2tiles  # GDAL 3.2+提供的gdal2tiles Python接口
+except ImportError:
+    gdal2tiles = None
+from datetime import date, datetime
 from django.conf import settings
-import json
+from django.core.cache import cache
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import numpy as np
+import hashlib
 import os
 import subprocess
 import logging
+import mmap
+import re
 import sys
 import math
+import threading
 import shutil
+import time
 
 # 配置日志记录器
 logger = logging.getLogger(__name__)
 
+# RPC校正后的影像使用Cloud-Optimized GeoTIFF格式：内部分块并自带金字塔概览，
+# 缩略图和低级别瓦片可直接读取概览层，无需扫描全分辨率数据
+COG_CREATION_OPTIONS = [
+    'COMPRESS=DEFLATE',
+    'BLOCKSIZE=256',
+    'OVERVIEW_RESAMPLING=AVERAGE',
+    'OVERVIEWS=IGNORE_EXISTING',
+    'BIGTIFF=IF_NEEDED',
+]
+
+# 进程内GDAL性能相关配置（不写入环境变量，避免gdal2tiles的每个子进程重复占用线程和缓存）
+GDAL_CONFIG_OPTIONS = {
+    'GDAL_NUM_THREADS': 'ALL_CPUS',  # 压缩/解压及Warp多线程
+    'VSI_CACHE': 'TRUE',  # 启用文件读取缓存
+    'GDAL_TIFF_INTERNAL_MASK': 'YES',  # 掩膜写入TIFF内部
+    'COMPRESS_OVERVIEW': 'DEFLATE',  # 外部概览压缩
+}
+# GDAL块缓存大小（字节）。处理流程也会在Web进程中直接执行，缓存常驻进程，需限制上限
+GDAL_CACHE_MAX = 64 << 20
+
+# ASTER标准波段描述
+_ASTER_BANDS = (
+    'VNIR Band 1 (Green)',
+    'VNIR Band 2 (Red)',
+    'VNIR Band 3N (NIR)',
+    'SWIR Band 4',
+    'SWIR Band 5',
+    'SWIR Band 6',
+    'SWIR Band 7',
+    'SWIR Band 8',
+    'SWIR Band 9',
+    'TIR Band 10',
+    'TIR Band 11',
+    'TIR Band 12',
+    'TIR Band 13',
+    'TIR Band 14',
+)
+
+# Sentinel-2标准波段描述
+_S2_BANDS = (
+    'Band 1 - Coastal aerosol',
+    'Band 2 - Blue',
+    'Band 3 - Green',
+    'Band 4 - Red',
+    'Band 5 - Vegetation Red Edge',
+    'Band 6 - Vegetation Red Edge',
+    'Band 7 - Vegetation Red Edge',
+    'Band 8 - NIR',
+    'Band 8A - Vegetation Red Edge',
+    'Band 9 - Water vapour',
+    'Band 10 - SWIR/Cirrus',
+    'Band 11 - SWIR',
+    'Band 12 - SWIR',
+)
+
+# 文件名中的日期：以下划线分隔的字段开头的8位数字（YYYYMMDD）
+_DATE_RE = re.compile(r'(?:^|_)(\d{8})')
+
+# 临时文件被占用（PermissionError）时的删除重试次数与间隔（秒）
+UNLINK_RETRIES = 5
+UNLINK_RETRY_DELAY = 0.2
+
+# 进程内GDAL环境是否已配置
+_CONFIGURED = False
+_CONFIGURE_LOCK = threading.Lock()
+
+# 文件名前缀与传感器类型的对应关系
+_PREFIX_MAP = (
+    ('S2', 'S2'),
+    ('GF5', 'GF5'),
+    ('AST', 'ASTER'),
+    ('PRS', 'PRISMA'),
+)
+
+
+
+@dataclass(frozen=True)
+class BandRecipe:
+    """传感器的RGB波段组合及渲染参数"""
+    bands: tuple  # 红、绿、蓝波段序号
+    scale: tuple  # 瓦片拉伸参数（源最小值、源最大值、输出最小值、输出最大值）
+    thumb_scale: tuple  # 缩略图拉伸参数
+    resample: str  # 瓦片输入VRT重采样方式
+    tile_resample: str  # gdal2tiles重采样方式
+    thumb_resample: str  # 缩略图重采样方式
+    nodata: object = 0  # 无数据值，None表示不设置
+    stretch_from_data: bool = False  # 是否根据数据实际范围拉伸
+
+
+# 各传感器的波段组合及渲染参数
+SENSOR_RECIPES = {
+    # Sentinel-2使用标准RGB波段组合
+    'S2': BandRecipe(
+        bands=(4, 3, 2),
+        scale=(0, 4096, 0, 255),
+        thumb_scale=(0, 4000, 0, 255),
+        resample='bilinear',
+        tile_resample='bilinear',
+        thumb_resample='bilinear',
+        nodata=None,
+    ),
+    # GF5高光谱数据，~630nm(红)、~550nm(绿)、~450nm(蓝)波段
+    'GF5': BandRecipe(
+        bands=(29, 20, 11),
+        scale=(0, 4096, 0, 255),
+        thumb_scale=(0, 2000, 0, 255),
+        resample='cubic',
+        tile_resample='cubic',
+        thumb_resample='bilinear',
+    ),
+    # PRISMA高光谱数据，波段组合同GF5
+    'PRISMA': BandRecipe(
+        bands=(29, 20, 11),
+        scale=(0, 4096, 0, 255),
+        thumb_scale=(0, 4000, 0, 255),
+        resample='average',
+        tile_resample='average',
+        thumb_resample='average',
+    ),
+    # ASTER VNIR波段 3N-2-1组合，按数据实际范围拉伸，下列范围为获取失败时的默认值
+    'ASTER': BandRecipe(
+        bands=(3, 2, 1),
+        scale=(0, 255, 0, 255),
+        thumb_scale=(0, 255, 0, 255),
+        resample='average',
+        tile_resample='near',
+        thumb_resample='near',
+        stretch_from_data=True,
+    ),
+}
+
+# gdal2tiles并行进程数（保留一个核心给缩略图生成等其他任务）
+TILE_PROCESSES = max(1, (os.cpu_count() or 4) - 1)
+
+# 瓦片生成串行执行：每次gdal2tiles已按TILE_PROCESSES占满CPU，
+# 批量处理和后台处理的多个线程同时生成瓦片只会相互争抢
+_TILE_LOCK = threading.Lock()
+
+
+def _fast_copy(src, dst):
+    """
+    复制文件，尽量避免数据拷贝
+    
+    同一文件系统下优先创建硬链接；否则尝试copy_file_range
+    （支持的文件系统上由内核完成拷贝或reflink）；均不可用时回退到shutil.copy2。
+    
+    Args:
+        src: 源文件路径
+        dst: 目标文件路径
+    """
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        if remaining > 0:
+            raise OSError(f'文件复制不完整: {src}')
+        shutil.copystat(src, dst)
+    except (AttributeError, OSError):
+        # Windows等平台不支持copy_file_range
+        shutil.copy2(src, dst)
+
+
+def _tile_manifest_key(ds, params):
+    """
+    计算瓦片金字塔的输入指纹
+    
+    由数据集涉及文件的大小、前1MB内容以及瓦片生成参数组成，
+    用于判断已有瓦片是否可以直接复用。
+    
+    Args:
+        ds: GDAL数据集对象
+        params: 影响瓦片结果的参数（缩放级别、波段、拉伸、重采样等）
+        
+    Returns:
+        str: SHA1十六进制摘要
+    """
+    digest = hashlib.sha1(repr(params).encode())
+    for path in sorted(ds.GetFileList() or []):
+        if not os.path.isfile(path):
+            continue
+        digest.update(f'{os.path.basename(path)}:{os.path.getsize(path)}'.encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read(1 << 20))
+    return digest.hexdigest()
+
+
+# ENVI头文件字段的正则表达式（直接匹配原始字节，只解码提取出的字段）
+_WL_RE = re.compile(rb'wavelength\s*=\s*\{([^}]*)\}', re.I)
+_UNITS_RE = re.compile(rb'wavelength units\s*=\s*(\S+)', re.I)
+_RPC_RE = re.compile(rb'rpc info|rational polynomial coefficients', re.I)
+_MAP_RE = re.compile(rb'map info\s*=\s*\{([^}]*)\}', re.I)
+
+
+def _parse_envi_header(path):
+    """
+    一次读取并解析ENVI头文件
+    
+    Args:
+        path: ENVI头文件路径
+        
+    Returns:
+        dict: 包含以下字段
+            - wavelength_info: 波长信息（波长列表和单位），不存在时为None
+            - has_rpc: 是否包含RPC模型信息
+            - map_info: map info字段内容，不存在时为None
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return {'wavelength_info': None, 'has_rpc': False, 'map_info': None}
+        # 内存映射文件，正则直接在映射区上匹配，避免整体读取和解码
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as text:
+            wl_match = _WL_RE.search(text)
+            units_match = _UNITS_RE.search(text)
+            map_match = _MAP_RE.search(text)
+            has_rpc = _RPC_RE.search(text) is not None
+            wl_str = wl_match.group(1).decode('latin-1') if wl_match else None
+            units = units_match.group(1).decode('latin-1') if units_match else 'Nanometers'  # 默认单位
+            map_info = map_match.group(1).decode('latin-1').strip() if map_match else None
+
+    wavelength_info = None
+    if wl_str is not None:
+        # 逐项转换，任何一项不是数字时抛出ValueError（np.fromstring遇错会静默截断）
+        wavelengths = np.array([w for w in wl_str.split(',') if w.strip()], dtype=np.float64)
+        # 单位转换：微米转纳米
+        if units.lower() == 'micrometers':
+            wavelengths *= 1000.0
+            units = 'Nanometers'
+        wavelength_info = {
+            'wavelengths': wavelengths.tolist(),  # 转为列表，便于JSON序列化
+            'units': units
+        }
+
+    return {
+        'wavelength_info': wavelength_info,
+        'has_rpc': has_rpc,
+        'map_info': map_info,
+    }
+
+
+# ASTER拉伸范围缓存，键为(数据集文件路径, 修改时间, 大小)，同名文件重新上传后不会复用旧结果
+_aster_stretch = {}
+# 缩略图线程和瓦片生成可能同时请求同一数据集的拉伸范围，加锁保证只计算一次
+_ASTER_STRETCH_LOCK = threading.Lock()
+
+
+def _aster_stretch_key(ds):
+    """返回数据集在拉伸范围缓存中的键"""
+    path = ds.GetDescription()
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path, None, None
+    return path, st.st_mtime_ns, st.st_size
+
+
+def _get_aster_range(ds):
+    """
+    估算ASTER数据的拉伸范围
+    
+    以1/8分辨率读取波段1、2，取有效像元的2%和98%分位数，
+    结果按数据集路径、修改时间和大小缓存，缩略图和瓦片生成共用。
+    
+    Args:
+        ds: GDAL数据集对象
+        
+    Returns:
+        tuple: (最小值, 最大值)
+    """
+    key = _aster_stretch_key(ds)
+    with _ASTER_STRETCH_LOCK:
+        if key not in _aster_stretch:
+            arr = ds.ReadAsArray(
+                0, 0, ds.RasterXSize, ds.RasterYSize,
+                buf_xsize=max(1, ds.RasterXSize // 8),
+                buf_ysize=max(1, ds.RasterYSize // 8),
+                band_list=[1, 2]
+            )
+            valid = arr[arr > 0]  # 排除无数据值
+            if valid.size == 0:
+                raise ValueError('ASTER数据无有效像元')
+            lo, hi = np.percentile(valid, [2, 98])
+            _aster_stretch[key] = (float(lo), float(hi))
+        return _aster_stretch[key]
+
+
+def _forget_aster_range(ds):
+    """处理结束后移除该数据集路径下的所有拉伸范围缓存"""
+    path = ds.GetDescription()
+    with _ASTER_STRETCH_LOCK:
+        for key in [k for k in _aster_stretch if k[0] == path]:
+            del _aster_stretch[key]
+
+
+def _resolve_scale(ds, recipe, default_scale):
+    """
+    获取波段拉伸参数
+    
+    Args:
+        ds: GDAL数据集对象
+        recipe: 传感器渲染参数
+        default_scale: 默认拉伸参数
+        
+    Returns:
+        list: [源最小值, 源最大值, 输出最小值, 输出最大值]
+    """
+    if recipe.stretch_from_data:
+        try:
+            min_val, max_val = _get_aster_range(ds)
+            logger.info(f"数据实际范围: min={min_val}, max={max_val}")
+            return [min_val, max_val, 0, 255]
+        except Exception as e:
+            logger.warning(f"获取数据范围失败: {str(e)}, 使用默认范围")
+    return list(default_scale)
+
+
+def _make_thumbnail(src_path, thumbnail_path, sensor_type):
+    """
+    生成影像缩略图
+    
+    独立打开数据集，可在后台线程中与瓦片生成并行执行。
+    
+    Args:
+        src_path: 影像文件路径
+        thumbnail_path: 缩略图输出路径
+        sensor_type: 传感器类型代码
+        
+    Raises:
+        Exception: 缩略图生成失败时抛出
+    """
+    ds = gdal.Open(src_path)
+    if not ds:
+        raise ValueError(f'无法打开影像文件: {src_path}')
+    try:
+        # 检查数据集信息
+        band_count = ds.RasterCount
+        logger.info(f"数据集波段数量: {band_count}")
+        logger.info(f"检测到的传感器类型: {sensor_type}")
+
+        # 根据传感器类型选择波段组合及渲染参数
+        recipe = SENSOR_RECIPES[sensor_type]
+        scale_params = _resolve_scale(ds, recipe, recipe.thumb_scale)
+        red_band, green_band, blue_band = recipe.bands
+        logger.info(f"使用波段: 红={red_band}, 绿={green_band}, 蓝={blue_band}")
+
+        try:
+            # 直接从数据集中选取RGB波段生成缩略图，无需中间VRT文件
+            gdal.Translate(
+                thumbnail_path, ds,
+                format='PNG',
+                outputType=gdal.GDT_Byte,
+                bandList=list(recipe.bands),
+                width=256, height=256,
+                scaleParams=[scale_params],
+                resampleAlg=recipe.thumb_resample,
+                noData=recipe.nodata
+            )
+            logger.info(f"使用{sensor_type}参数生成缩略图")
+
+            # 验证缩略图生成
+            if not os.path.exists(thumbnail_path):
+                raise Exception("缩略图生成失败")
+
+        except Exception as e:
+            logger.error(f"缩略图生成过程出错: {str(e)}")
+            raise
+    finally:
+        ds = None
+
+
+def process_envi_file(hdr_path, img_path):
+    """
+    在当前进程中直接处理一对ENVI文件
+    
+    供EnviProcessor等代码调用，省去call_command的命令查找和参数解析。
+    
+    Args:
+        hdr_path: ENVI头文件路径
+        img_path: ENVI影像文件路径
+        
+    Returns:
+        int: 创建或更新的EnviData记录ID
+    """
+    command = Command()
+    command.handle(hdr_path=hdr_path, img_path=img_path)
+    return command.envi_data_id
+
+
+# 头文件解析结果在Django缓存中的保留时间（秒）
+HEADER_CACHE_TIMEOUT = 86400
+
+
+@lru_cache(maxsize=64)
+def _parse_cached(path, mtime_ns, size):
+    """按路径、修改时间和大小缓存头文件解析结果，文件变化后自动失效"""
+    return _parse_envi_header(path)
+
+
+def _load_envi_header(path):
+    """
+    获取ENVI头文件解析结果
+    
+    依次查询进程内缓存和Django缓存（配置Redis时可跨命令进程复用），
+    均未命中时解析头文件。
+    
+    Args:
+        path: ENVI头文件路径
+        
+    Returns:
+        dict: 同_parse_envi_header
+    """
+    st = os.stat(path)
+    key = f'envi_header:{hashlib.sha1(path.encode()).hexdigest()}:{st.st_mtime_ns}:{st.st_size}'
+    header = cache.get(key)
+    if header is None:
+        header = _parse_cached(path, st.st_mtime_ns, st.st_size)
+        cache.set(key, header, HEADER_CACHE_TIMEOUT)
+    return header
+
+
+def _get_wgs84():
+    """
+    获取WGS84坐标系对象
+    
+    ImportFromEPSG需要查询PROJ数据库，结果在进程内缓存复用。
+    OSR对象不能跨线程共享，缓存按线程区分。
+    
+    Returns:
+        osr.SpatialReference: EPSG:4326坐标系
+    """
+    return _build_wgs84(threading.get_ident())
+
+
+@lru_cache(maxsize=32)
+def _build_wgs84(thread_id):
+    """创建WGS84坐标系对象，按线程ID缓存"""
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    return srs
+
+
+def _get_transform(src_wkt):
+    """
+    获取从源坐标系到WGS84的坐标转换器
+    
+    按源坐标系WKT缓存，避免重复构建PROJ转换管线。
+    转换器不是线程安全的，缓存按线程区分。
+    
+    Args:
+        src_wkt: 源坐标系WKT字符串，为空时视为WGS84
+        
+    Returns:
+        osr.CoordinateTransformation: 坐标转换器
+    """
+    return _build_transform(src_wkt, threading.get_ident())
+
+
+@lru_cache(maxsize=32)
+def _build_transform(src_wkt, thread_id):
+    """创建坐标转换器，按源坐标系WKT和线程ID缓存"""
+    src_srs = osr.SpatialReference()
+    if src_wkt:
+        src_srs.ImportFromWkt(src_wkt)
+    else:
+        src_srs.ImportFromEPSG(4326)
+    return osr.CoordinateTransformation(src_srs, _get_wgs84())
+
+@lru_cache(maxsize=256)
+def _bounds_from_signature(geo_transform, width, height, src_wkt, swap_axes):
+    """
+    由地理变换参数和影像尺寸计算WGS84下的边界角点
+
+    结果只取决于输入参数，按参数缓存，同一数据重复处理时无需再次进行坐标转换。
+
+    Args:
+        geo_transform: 地理变换参数元组
+        width: 影像宽度（像素）
+        height: 影像高度（像素）
+        src_wkt: 源坐标系WKT字符串
+        swap_axes: 是否交换坐标顺序（GF5数据为纬度-经度）
+
+    Returns:
+        tuple: 闭合多边形的角点坐标元组
+
+    Raises:
+        Exception: 坐标转换失败
+    """
+    # 计算四个角点坐标
+    points = [
+        (geo_transform[0], geo_transform[3]),  # 左上角
+        (geo_transform[0] + width * geo_transform[1], geo_transform[3]),  # 右上角
+        (geo_transform[0] + width * geo_transform[1], geo_transform[3] + height * geo_transform[5]),  # 右下角
+        (geo_transform[0], geo_transform[3] + height * geo_transform[5]),  # 左下角
+        (geo_transform[0], geo_transform[3])  # 闭合多边形
+    ]
+
+    # GF5数据需要交换坐标顺序（纬度-经度），其他数据保持原有顺序（经度-纬度）
+    src_points = [(y, x) if swap_axes else (x, y) for x, y in points]
+    # 一次调用转换全部角点；转换失败时直接抛出异常（lru_cache不缓存异常），
+    # 不能以未转换的原始坐标作为结果，否则会被缓存并用于之后相同参数的数据
+    transform = _get_transform(src_wkt)
+    transformed_points = tuple((lon, lat) for lon, lat, _ in transform.TransformPoints(src_points))
+
+    # 记录转换结果（仅在INFO级别启用时格式化坐标列表）
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("原始坐标: %s", [(round(x, 8), round(y, 8)) for x, y in points])
+        logger.info("转换后坐标: %s", [(round(x, 8), round(y, 8)) for x, y in transformed_points])
+
+    return transformed_points
+
 class Command(BaseCommand):
     """
     ENVI数据处理命令类
@@ -70,6 +602,7 @@ class Command(BaseCommand):
         - GDAL数据路径
         - 系统PATH路径
         - GDAL配置选项
+        进程级配置只在首次调用时执行，之后每次仅验证影像格式。
         
         Args:
             hdr_path: ENVI头文件路径
@@ -79,6 +612,24 @@ class Command(BaseCommand):
             Exception: PROJ数据库文件不存在
             ValueError: 无效的影像文件格式
         """
+        global _CONFIGURED
+        if not _CONFIGURED:
+            with _CONFIGURE_LOCK:  # 批量处理时多个线程可能同时首次配置
+                if not _CONFIGURED:
+                    self._configure_gdal_env()
+                    _CONFIGURED = True
+        
+        # 验证影像格式
+        if not gdal.IdentifyDriver(img_path):
+            raise ValueError('无效的影像文件格式')
+
+    def _configure_gdal_env(self):
+        """
+        配置进程级GDAL环境（路径、配置项、驱动注册），每个进程只需执行一次
+        
+        Raises:
+            Exception: PROJ数据库文件不存在
+        """
         # 设置GDAL相关路径
         proj_path = r'D:\Anaconda3\envs\envi_web\Library\share\proj'
         gdal_path = r'D:\Anaconda3\envs\envi_web\Library\share\gdal'
@@ -99,11 +650,10 @@ class Command(BaseCommand):
         gdal.SetConfigOption('GDAL_DATA', gdal_path)
         gdal.SetConfigOption('PROJ_LIB', proj_path)
         gdal.SetConfigOption('USE_RPC', 'YES')  # 启用RPC模型支持
+        for key, value in GDAL_CONFIG_OPTIONS.items():
+            gdal.SetConfigOption(key, value)
+        gdal.SetCacheMax(GDAL_CACHE_MAX)  # 缓存初始化后GDAL_CACHEMAX配置项不再生效，直接设置
         gdal.AllRegister()  # 注册所有GDAL驱动
-        
-        # 验证影像格式
-        if not gdal.IdentifyDriver(img_path):
-            raise ValueError('无效的影像文件格式')
         gdal.UseExceptions()  # 启用GDAL异常处理
 
     def parse_filename(self, hdr_path):
@@ -120,7 +670,39 @@ class Command(BaseCommand):
         """
         return os.path.splitext(os.path.basename(hdr_path))[0]
 
-    def calculate_bounds(self, dataset):
+    def _resolve_source_srs(self, dataset, map_info=None):
+        """
+        确定数据集的源坐标系
+        
+        优先使用GDAL读取的投影信息；缺失或无法解析时使用WGS84。
+        
+        Args:
+            dataset: GDAL数据集对象
+            map_info: ENVI头文件中的map info字段，仅用于日志提示
+            
+        Returns:
+            osr.SpatialReference: 源坐标系（WGS84时为共享的缓存对象，不应修改）
+        """
+        projection = dataset.GetProjection()
+        if not projection:
+            # 尝试使用ENVI头文件中的投影信息
+            logger.warning("GDAL未检测到投影信息，尝试从ENVI头文件读取...")
+            if map_info:
+                logger.info("从ENVI头文件中检测到map info")
+                logger.info(f"Map info: {map_info}")
+            else:
+                logger.warning("在ENVI头文件中也未找到投影信息，使用默认WGS84")
+            return _get_wgs84()
+
+        src_srs = osr.SpatialReference()
+        try:
+            src_srs.ImportFromWkt(projection)
+        except Exception as e:
+            logger.error(f"解析投影信息失败: {str(e)}，使用默认WGS84")
+            return _get_wgs84()
+        return src_srs
+
+    def calculate_bounds(self, dataset, src_srs=None):
         """
         计算数据边界范围
         
@@ -132,6 +714,7 @@ class Command(BaseCommand):
         
         Args:
             dataset: GDAL数据集对象
+            src_srs: 源坐标系，未提供时根据数据集确定
             
         Returns:
             Polygon: Django GIS多边形对象，表示数据边界
@@ -141,68 +724,19 @@ class Command(BaseCommand):
         """
         try:
             # 获取原始坐标系
-            src_srs = osr.SpatialReference()
-            projection = dataset.GetProjection()
-            
-            # 处理投影信息缺失的情况
-            if not projection:
-                logger.warning("未检测到投影信息，尝试使用RPC信息...")
-                src_srs.ImportFromEPSG(4326)  # 默认使用WGS84
-            else:
-                try:
-                    src_srs.ImportFromWkt(projection)
-                except Exception as e:
-                    logger.error(f"解析投影信息失败: {str(e)}，使用默认WGS84")
-                    src_srs.ImportFromEPSG(4326)
-            
-            # 创建目标坐标系（WGS84）
-            tgt_srs = osr.SpatialReference()
-            tgt_srs.ImportFromEPSG(4326)
-            
-            # 创建坐标转换器
-            transform = osr.CoordinateTransformation(src_srs, tgt_srs)
+            if src_srs is None:
+                src_srs = self._resolve_source_srs(dataset)
             
-            # 获取原始地理变换参数
-            geo_transform = dataset.GetGeoTransform()
-            width = dataset.RasterXSize
-            height = dataset.RasterYSize
-
-            # 计算四个角点坐标
-            points = [
-                (geo_transform[0], geo_transform[3]),  # 左上角
-                (geo_transform[0] + width * geo_transform[1], geo_transform[3]),  # 右上角
-                (geo_transform[0] + width * geo_transform[1], geo_transform[3] + height * geo_transform[5]),  # 右下角
-                (geo_transform[0], geo_transform[3] + height * geo_transform[5]),  # 左下角
-                (geo_transform[0], geo_transform[3])  # 闭合多边形
-            ]
-            
-            # 执行坐标转换
-            transformed_points = []
+            # 按地理变换参数、影像尺寸和坐标系计算（缓存的）角点坐标
             basename = self.parse_filename(dataset.GetDescription())
-            is_gf5 = basename.startswith('GF5')  # 检查是否为GF5数据
-            
-            for x, y in points:
-                try:
-                    if is_gf5:
-                        # GF5数据需要交换坐标顺序（纬度-经度）
-                        lon, lat, _ = transform.TransformPoint(y, x)
-                    else:
-                        # 其他数据保持原有顺序（经度-纬度）
-                        lon, lat, _ = transform.TransformPoint(x, y)
-                    
-                    transformed_points.append((lon, lat))
-                except Exception as e:
-                    logger.error(f"坐标转换失败: {str(e)}")
-                    # 转换失败时使用原始坐标
-                    if is_gf5:
-                        transformed_points.append((y, x))
-                    else:
-                        transformed_points.append((x, y))
+            transformed_points = _bounds_from_signature(
+                tuple(dataset.GetGeoTransform()),
+                dataset.RasterXSize,
+                dataset.RasterYSize,
+                src_srs.ExportToWkt(),
+                basename.startswith('GF5')  # 检查是否为GF5数据
+            )
 
-            # 记录转换结果
-            logger.info(f"原始坐标: {[(round(x, 8), round(y, 8)) for x, y in points]}")
-            logger.info(f"转换后坐标: {[(round(x, 8), round(y, 8)) for x, y in transformed_points]}")
-           
             # 创建并返回多边形
             return Polygon(transformed_points)
             
@@ -210,7 +744,7 @@ class Command(BaseCommand):
             logger.error(f"计算边界失败: {str(e)}")
             raise
 
-    def generate_tiles(self, tif_path, basename):
+    def generate_tiles(self, ds, basename, sensor_type):
         """
         生成地图瓦片
         
@@ -221,8 +755,9 @@ class Command(BaseCommand):
         - 多进程并行处理
         
         Args:
-            tif_path: GeoTIFF文件路径
+            ds: 已打开的GeoTIFF数据集
             basename: 基础文件名
+            sensor_type: 传感器类型代码
             
         Returns:
             str: 瓦片URL模板
@@ -234,221 +769,204 @@ class Command(BaseCommand):
         vrt_path = os.path.join(settings.BASE_DIR, 'static', 'temp', f'{basename}.vrt')
         os.makedirs(os.path.dirname(vrt_path), exist_ok=True)
 
-        # 获取源数据信息
-        ds = gdal.Open(tif_path)
-        try:
-            # 获取并验证坐标系
-            src_srs = osr.SpatialReference()
-            src_srs.ImportFromWkt(ds.GetProjection())
-            epsg = src_srs.GetAuthorityCode(None)
-            if not epsg:
-                epsg = '4326'  # 默认使用WGS84
-            
-            # 获取图像参数
-            width = ds.RasterXSize
-            height = ds.RasterYSize
-            geotransform = ds.GetGeoTransform()
-            
-            # 根据传感器类型设置缩放级别
-            if basename.startswith('GF5'):
-                # GF5高光谱数据（30m分辨率）
-                min_zoom = 8   # 最小缩放级别（约610米/像素）
-                max_zoom = 12  # 最大缩放级别（约38米/像素）
-                logger.info(f'GF5数据使用固定缩放级别范围: {min_zoom}-{max_zoom}')
-            elif basename.startswith('AST'):
-                # ASTER数据（15m分辨率）
-                min_zoom = 10
-                max_zoom = 14
-                logger.info(f'ASTER数据使用固定缩放级别范围: {min_zoom}-{max_zoom}')
-            elif basename.startswith('PRS'):
-                # PRISMA数据（30m分辨率）
-                min_zoom = 8
-                max_zoom = 12
-                logger.info(f'PRISMA数据使用固定缩放级别范围: {min_zoom}-{max_zoom}')
-            else:
-                # Sentinel-2等其他数据，根据分辨率动态计算
-                resolution = abs(geotransform[1])  # 像素宽度（X方向分辨率）
-                logger.info(f'数据分辨率: {resolution}米')
-                data_extent = width * resolution
-                min_zoom = max(1, int(round(math.log2(40075016.686 / data_extent))))
-                max_zoom = 14 if resolution <= 10 else (13 if resolution <= 20 else 12)
-            
-        finally:
-            ds = None
-
-        # 创建VRT文件
-        basename = os.path.splitext(os.path.basename(tif_path))[0]
-        sensor_type = self._detect_sensor_type(basename)
+        # 获取并验证坐标系
+        src_srs = osr.SpatialReference()
+        src_srs.ImportFromWkt(ds.GetProjection())
+        epsg = src_srs.GetAuthorityCode(None)
+        if not epsg:
+            epsg = '4326'  # 默认使用WGS84
         
-        # 根据传感器类型选择不同的波段组合和处理参数
-        if sensor_type == 'PRISMA':
-            # PRISMA高光谱数据使用特定波段组合（约RGB波段）
-            vrt_cmd = (
-                f'gdal_translate -of VRT -ot Byte '
-                f'-scale_1 0 4096 0 255 '  # 数据拉伸参数
-                f'-scale_2 0 4096 0 255 '
-                f'-scale_3 0 4096 0 255 '
-                f'-b 29 -b 20 -b 11 '  # 使用~630nm(红)、~550nm(绿)、~450nm(蓝)波段
-                f'-r average '  # 使用平均值重采样
-                f'"{tif_path}" "{vrt_path}"'
-            )
+        # 获取图像参数
+        width = ds.RasterXSize
+        height = ds.RasterYSize
+        geotransform = ds.GetGeoTransform()
+        
+        # 根据传感器类型设置缩放级别
+        if sensor_type == 'GF5':
+            # GF5高光谱数据（30m分辨率）
+            min_zoom = 8   # 最小缩放级别（约610米/像素）
+            max_zoom = 12  # 最大缩放级别（约38米/像素）
+            logger.info(f'GF5数据使用固定缩放级别范围: {min_zoom}-{max_zoom}')
         elif sensor_type == 'ASTER':
-            # ASTER使用VNIR波段，2-1-1波段组合（真彩色）
-            # 获取数据的实际范围以优化拉伸参数
-            ds = gdal.Open(tif_path)
-            try:
-                band1 = ds.GetRasterBand(1)
-                band2 = ds.GetRasterBand(2)
-                stats1 = band1.GetStatistics(True, True)
-                stats2 = band2.GetStatistics(True, True)
-                min_val = min(stats1[0], stats2[0])
-                max_val = max(stats1[1], stats2[1])
-                logger.info(f"ASTER数据实际范围: min={min_val}, max={max_val}")
-            except Exception as e:
-                logger.warning(f"获取数据范围失败: {str(e)}, 使用默认范围")
-                min_val = 0
-                max_val = 255
-            finally:
-                ds = None
-
-            vrt_cmd = (
-                f'gdal_translate -of VRT -ot Byte '
-                f'-scale_1 {min_val} {max_val} 0 255 '  # 红色波段（波段2）
-                f'-scale_2 {min_val} {max_val} 0 255 '  # 绿色波段（波段1）
-                f'-scale_3 {min_val} {max_val} 0 255 '  # 蓝色波段（波段1）
-                f'-b 3 -b 2 -b 1 '  # 使用2-1-1波段组合
-                f'-r average '  # 使用平均值重采样
-                f'"{tif_path}" "{vrt_path}"'
-            )
-        elif sensor_type == 'GF5':
-            # GF5高光谱数据使用特定波段组合
-            vrt_cmd = (
-                f'gdal_translate -of VRT -ot Byte '
-                f'-scale_1 0 4096 0 255 '
-                f'-scale_2 0 4096 0 255 '
-                f'-scale_3 0 4096 0 255 '
-                f'-b 29 -b 20 -b 11 '  # 使用类似PRISMA的波段组合
-                f'-r cubic '  # 使用三次卷积重采样
-                f'"{tif_path}" "{vrt_path}"'
-            )
+            # ASTER数据（15m分辨率）
+            min_zoom = 10
+            max_zoom = 14
+            logger.info(f'ASTER数据使用固定缩放级别范围: {min_zoom}-{max_zoom}')
+        elif sensor_type == 'PRISMA':
+            # PRISMA数据（30m分辨率）
+            min_zoom = 8
+            max_zoom = 12
+            logger.info(f'PRISMA数据使用固定缩放级别范围: {min_zoom}-{max_zoom}')
         else:
-            # Sentinel-2使用标准RGB波段组合
-            vrt_cmd = (
-                f'gdal_translate -of VRT -ot Byte '
-                f'-scale_1 0 4096 0 255 '
-                f'-scale_2 0 4096 0 255 '
-                f'-scale_3 0 4096 0 255 '
-                f'-b 4 -b 3 -b 2 '  # 使用标准RGB波段
-                f'-r bilinear '  # 使用双线性重采样
-                f'"{tif_path}" "{vrt_path}"'
-            )
+            # Sentinel-2等其他数据，根据分辨率动态计算
+            resolution = abs(geotransform[1])  # 像素宽度（X方向分辨率）
+            logger.info(f'数据分辨率: {resolution}米')
+            data_extent = width * resolution
+            min_zoom = max(1, int(round(math.log2(40075016.686 / data_extent))))
+            max_zoom = 14 if resolution <= 10 else (13 if resolution <= 20 else 12)
 
-        # 执行VRT文件创建命令
-        subprocess.run(vrt_cmd, shell=True, check=True,
-                     stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                     universal_newlines=True)
+        # 根据传感器类型选择波段组合和处理参数
+        recipe = SENSOR_RECIPES[sensor_type]
+        band_list = list(recipe.bands)
+        scale_params = [_resolve_scale(ds, recipe, recipe.scale)] * 3
+        resample = recipe.resample
 
-        # 创建瓦片目录
+        # 动态瓦片模式：只生成瓦片数据源，不预生成瓦片金字塔
+        if settings.GEODATA_DYNAMIC_TILES:
+            return self._build_tile_cog(ds, basename, band_list, scale_params, resample)
+
+        # 瓦片目录中的清单与本次输入一致时，直接复用已有瓦片
         tile_dir = os.path.join(settings.BASE_DIR, 'static', 'tiles', basename)
+        tile_url = f'/static/tiles/{basename}/{{z}}/{{x}}/{{y}}.png'
+        manifest_path = os.path.join(tile_dir, '.manifest')
+        manifest_key = _tile_manifest_key(
+            ds, (min_zoom, max_zoom, sensor_type, band_list, scale_params, resample)
+        )
+        try:
+            with open(manifest_path, 'r') as f:
+                if f.read().strip() == manifest_key:
+                    logger.info(f'瓦片已是最新，跳过生成: {tile_dir}')
+                    return tile_url
+        except OSError:
+            pass
+
+        # 直接基于已打开的数据集创建VRT文件
+        tile_src = gdal.Translate(
+            vrt_path, ds,
+            format='VRT',
+            outputType=gdal.GDT_Byte,
+            bandList=band_list,
+            scaleParams=scale_params,
+            resampleAlg=resample
+        )
+
+        # 源数据没有金字塔时，为瓦片输入构建外部概览（.ovr），
+        # gdal2tiles生成低级别瓦片时直接读取概览层，无需从全分辨率重采样
+        if ds.GetRasterBand(1).GetOverviewCount() == 0:
+            levels = []
+            factor = 2
+            while min(width, height) // factor >= 256:
+                levels.append(factor)
+                factor *= 2
+            if levels:
+                ovr_resample = 'NEAREST' if resample == 'near' else 'AVERAGE'
+                tile_src.BuildOverviews(ovr_resample, levels)
+                logger.info(f'已生成瓦片输入概览，级别: {levels}')
+        tile_src = None  # 关闭数据集，确保VRT和概览写入磁盘
+
+        # 创建瓦片目录
         os.makedirs(tile_dir, exist_ok=True)
 
-        # 验证gdal2tiles工具路径
-        gdal2tiles_path = r'D:\Anaconda3\envs\envi_web\Scripts\gdal2tiles.py'
-        if not os.path.exists(gdal2tiles_path):
-            raise FileNotFoundError(f'找不到gdal2tiles.py，已尝试路径: {gdal2tiles_path}')
+        # 通用瓦片生成参数
+        gdal2tiles_args = [
+            '-p', 'mercator',  # 使用Web墨卡托投影
+            f'--s_srs=EPSG:{epsg}',  # 源数据坐标系
+            '-z', f'{min_zoom}-{max_zoom}',  # 缩放级别范围
+            '--xyz',  # 使用XYZ瓦片格式
+            f'--processes={TILE_PROCESSES}',  # 按CPU核心数并行处理
+            '--tilesize=256',  # 瓦片尺寸
+            '--webviewer=none',  # 不生成网页浏览器模板
+            '--tmscompatible',  # 生成TMS兼容瓦片
+        ]
 
-        python_exe = r'D:\Anaconda3\envs\envi_web\python.exe'
-        if not os.path.exists(python_exe):
-            raise FileNotFoundError(f'找不到Python解释器，路径: {python_exe}')
-        
         # 根据传感器类型设置瓦片生成参数
-        if sensor_type == 'ASTER':
-            # ASTER数据处理参数
-            gdal2tiles_cmd = (
-                f'"{python_exe}" "{gdal2tiles_path}" '
-                f'-p mercator '  # 使用Web墨卡托投影
-                f'--s_srs EPSG:{epsg} '  # 源数据坐标系
-                f'-z {min_zoom}-{max_zoom} '  # 缩放级别范围
-                f'--xyz '  # 使用XYZ瓦片格式
-                f'--resampling=near '  # 最近邻重采样
-                f'--processes=4 '  # 使用4个进程并行处理
-                f'-w all '  # 处理所有像素
-                f'--srcnodata 0 '  # 设置源数据中的无数据值
-                f'--tmscompatible '  # 生成TMS兼容瓦片
-                f'"{vrt_path}" "{tile_dir}"'
-            )
-            logger.info("使用ASTER专用参数生成瓦片")
+        gdal2tiles_args.append(f'--resampling={recipe.tile_resample}')
+        if recipe.nodata is not None:
+            gdal2tiles_args.append(f'--srcnodata={recipe.nodata}')  # 设置源数据中的无数据值
+        logger.info(f"使用{sensor_type}参数生成瓦片")
 
-        elif sensor_type == 'PRISMA':
-            # PRISMA高光谱数据处理参数
-            gdal2tiles_cmd = (
-                f'"{python_exe}" "{gdal2tiles_path}" '
-                f'-p mercator '
-                f'--s_srs EPSG:{epsg} '
-                f'-z {min_zoom}-{max_zoom} '
-                f'--xyz '
-                f'--resampling=average '  # 使用平均值重采样
-                f'--processes=4 '
-                f'--srcnodata 0 '
-                f'--tmscompatible '
-                f'"{vrt_path}" "{tile_dir}"'
-            )
-            logger.info("使用PRISMA专用参数生成瓦片")
-
-        elif sensor_type == 'GF5':
-            # GF5高光谱数据处理参数
-            gdal2tiles_cmd = (
-                f'"{python_exe}" "{gdal2tiles_path}" '
-                f'-p mercator '
-                f'--s_srs EPSG:{epsg} '
-                f'-z {min_zoom}-{max_zoom} '
-                f'--xyz '
-                f'--resampling=cubic '  # 使用三次卷积重采样
-                f'--processes=4 '
-                f'--srcnodata 0 '
-                f'--tmscompatible '
-                f'"{vrt_path}" "{tile_dir}"'
-            )
-            logger.info("使用GF5专用参数生成瓦片")
+        gdal2tiles_args += [vrt_path, tile_dir]
+        logger.info(f"执行瓦片生成命令: {gdal2tiles_args}")
 
-        else:
-            # Sentinel-2等其他数据使用标准参数
-            gdal2tiles_cmd = (
-                f'"{python_exe}" "{gdal2tiles_path}" '
-                f'-p mercator '
-                f'--s_srs EPSG:{epsg} '
-                f'-z {min_zoom}-{max_zoom} '
-                f'--xyz '
-                f'--resampling=bilinear '  # 使用双线性重采样
-                f'--processes=4 '
-                f'--tmscompatible '
-                f'"{vrt_path}" "{tile_dir}"'
-            )
-            logger.info("使用标准参数生成瓦片")
+        try:
+            with _TILE_LOCK:
+                if gdal2tiles is None:
+                    # 旧版GDAL回退到命令行脚本
+                    gdal2tiles_path = r'D:\Anaconda3\envs\envi_web\Scripts\gdal2tiles.py'
+                    if not os.path.exists(gdal2tiles_path):
+                        raise FileNotFoundError(f'找不到gdal2tiles.py，已尝试路径: {gdal2tiles_path}')
 
-        logger.info(f"执行瓦片生成命令: {gdal2tiles_cmd}")
+                    python_exe = r'D:\Anaconda3\envs\envi_web\python.exe'
+                    if not os.path.exists(python_exe):
+                        raise FileNotFoundError(f'找不到Python解释器，路径: {python_exe}')
+                    command = [python_exe, gdal2tiles_path]
+                elif (int(gdal.VersionInfo()) >= 3050000
+                      and threading.current_thread() is threading.main_thread()):
+                    # GDAL 3.5+且在主线程中（命令行执行）：进程内调用gdal2tiles，
+                    # 省去启动解释器和重新加载GDAL的开销，且概览瓦片同样按--processes并行生成
+                    command = None
+                else:
+                    # 在工作线程中（Web进程的批量/后台处理）调用时，gdal2tiles的多进程
+                    # 会从多线程进程fork，可能继承被其他线程持有的锁而死锁，改用独立子进程
+                    command = [sys.executable, '-m', 'osgeo_utils.gdal2tiles']
 
-        try:
-            # 执行瓦片生成命令
-            result = subprocess.run(gdal2tiles_cmd, shell=True, check=True,
-                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                         universal_newlines=True)
-            logger.info(f'瓦片生成输出: {result.stdout}')
-            if result.stderr:
-                logger.warning(f'瓦片生成警告: {result.stderr}')
+                if command is None:
+                    ret = gdal2tiles.main(['gdal2tiles'] + gdal2tiles_args, called_from_main=False)
+                    if ret:
+                        raise RuntimeError(f'瓦片生成失败，gdal2tiles返回码: {ret}')
+                else:
+                    result = subprocess.run(command + gdal2tiles_args,
+                                            check=True, capture_output=True, text=True)
+                    logger.info(f'瓦片生成输出: {result.stdout}')
+                    if result.stderr:
+                        logger.warning(f'瓦片生成警告: {result.stderr}')
             
             logger.info(f'瓦片生成完成，缩放级别范围: {min_zoom}-{max_zoom}')
+
+            # 记录本次输入指纹
+            with open(manifest_path, 'w') as f:
+                f.write(manifest_key)
             
         except subprocess.CalledProcessError as e:
             logger.error(f'瓦片生成失败: {e.stderr}')
             raise
 
         # 清理临时文件
-        if os.path.exists(vrt_path):
-            os.remove(vrt_path)
+        for path in (vrt_path, f'{vrt_path}.ovr'):
+            if os.path.exists(path):
+                os.remove(path)
         
         # 返回瓦片URL模板
-        return f'/static/tiles/{basename}/{{z}}/{{x}}/{{y}}.png'
+        return tile_url
+
+    def _build_tile_cog(self, ds, basename, band_list, scale_params, resample):
+        """
+        生成动态瓦片使用的Cloud-Optimized GeoTIFF
+        
+        按瓦片的波段组合和拉伸参数输出8位RGB影像，使用Web墨卡托瓦片网格
+        （GoogleMapsCompatible）分块，每个瓦片请求只需读取对应的数据块或概览块。
+        
+        Args:
+            ds: 已打开的数据集
+            basename: 基础文件名
+            band_list: RGB波段列表
+            scale_params: 拉伸参数
+            resample: 重采样方式
+            
+        Returns:
+            str: 动态瓦片URL模板
+        """
+        os.makedirs(settings.TILE_COG_DIR, exist_ok=True)
+        cog_path = os.path.join(settings.TILE_COG_DIR, f'{basename}.tif')
+        cog_resample = 'NEAREST' if resample == 'near' else resample.upper()
+
+        gdal.Translate(
+            cog_path, ds,
+            format='COG',
+            outputType=gdal.GDT_Byte,
+            bandList=band_list,
+            scaleParams=scale_params,
+            noData=0,
+            creationOptions=COG_CREATION_OPTIONS + [
+                'TILING_SCHEME=GoogleMapsCompatible',
+                f'RESAMPLING={cog_resample}',
+            ]
+        )
+        logger.info(f'动态瓦片数据源生成完成: {cog_path}')
+
+        # URL带上数据源的修改时间，同名文件重新入库后浏览器不会继续使用缓存的旧瓦片
+        version = os.stat(cog_path).st_mtime_ns
+        return f'/geodata/api/tiles/{basename}/{{z}}/{{x}}/{{y}}.png?v={version}'
 
     def _detect_sensor_type(self, basename):
         """
@@ -462,16 +980,10 @@ class Command(BaseCommand):
         Returns:
             str: 传感器类型代码（S2/GF5/ASTER/PRISMA）
         """
-        if basename.startswith('S2'):
-            return 'S2'
-        elif basename.startswith('GF5'):
-            return 'GF5'
-        elif basename.startswith('AST'):
-            return 'ASTER'
-        elif basename.startswith('PRS'):
-            return 'PRISMA'
-        else:
-            return 'S2'  # 默认使用S2
+        for prefix, sensor_type in _PREFIX_MAP:
+            if basename.startswith(prefix):
+                return sensor_type
+        return 'S2'  # 默认使用S2
 
     def handle(self, *args, **options):
         """
@@ -515,9 +1027,9 @@ class Command(BaseCommand):
             
             # 避免重复复制
             if not os.path.exists(target_hdr):
-                shutil.copy2(hdr_path, target_hdr)
+                _fast_copy(hdr_path, target_hdr)
             if not os.path.exists(target_img):
-                shutil.copy2(img_path, target_img)
+                _fast_copy(img_path, target_img)
             
             # 更新文件路径
             hdr_path = target_hdr
@@ -528,68 +1040,35 @@ class Command(BaseCommand):
             basename = self.parse_filename(hdr_path)
             sensor_type = self._detect_sensor_type(basename)
 
-            # 提取波长信息
-            wavelength_info = None
+            # 解析头文件（波长、RPC、map info一次读取）
             try:
-                with open(hdr_path, 'r') as f:
-                    header_content = f.read()
-                    # 解析波长信息
-                    wavelength_start = header_content.find('wavelength = {')
-                    if wavelength_start != -1:
-                        wavelength_end = header_content.find('}', wavelength_start)
-                        wavelength_str = header_content[wavelength_start:wavelength_end+1]
-                        wavelength_list = [float(w.strip()) for w in wavelength_str.replace('wavelength = {', '').replace('}', '').split(',') if w.strip()]
-                        
-                        # 获取波长单位
-                        units_start = header_content.find('wavelength units = ')
-                        if units_start != -1:
-                            units_end = header_content.find('\n', units_start)
-                            units = header_content[units_start:units_end].split('=')[1].strip()
-                        else:
-                            units = 'Nanometers'  # 默认单位
-                        
-                        wavelength_info = {
-                            'wavelengths': wavelength_list,
-                            'units': units
-                        }
-                        
-                        # 单位转换：微米转纳米
-                        if units.lower() == 'micrometers':
-                            wavelength_info['wavelengths'] = [w * 1000 for w in wavelength_list]
-                            wavelength_info['units'] = 'Nanometers'
-                            
-                    logger.info(f"检测到波长信息: {len(wavelength_list) if wavelength_list else 0}个波段")
+                header = _load_envi_header(hdr_path)
             except Exception as e:
-                logger.warning(f"波长信息提取失败: {str(e)}")
+                logger.warning(f"头文件解析失败: {str(e)}")
+                header = {'wavelength_info': None, 'has_rpc': False, 'map_info': None}
 
-            # 检查RPC信息
-            has_rpc = False
-            try:
-                with open(hdr_path, 'r') as f:
-                    header_content = f.read()
-                    if any(term in header_content.lower() for term in ['rpc info', 'rational polynomial coefficients']):
-                        has_rpc = True
-                        logger.info("检测到RPC模型信息")
-            except Exception as e:
-                logger.warning(f"读取头文件RPC信息失败: {str(e)}")
+            wavelength_info = header['wavelength_info']
+            wavelength_count = len(wavelength_info['wavelengths']) if wavelength_info else 0
+            logger.info(f"检测到波长信息: {wavelength_count}个波段")
+
+            has_rpc = header['has_rpc']
+            if has_rpc:
+                logger.info("检测到RPC模型信息")
 
-            # 格式转换：ENVI -> GeoTIFF
-            tif_path = os.path.join(settings.BASE_DIR, 'static', 'temp', f'{basename}.tif')
-            os.makedirs(os.path.dirname(tif_path), exist_ok=True)
+            # 创建引用原始ENVI数据的VRT，避免复制整幅影像
+            work_path = os.path.join(settings.BASE_DIR, 'static', 'temp', f'{basename}_src.vrt')
+            os.makedirs(os.path.dirname(work_path), exist_ok=True)
             
             # 清理已存在的临时文件
-            if os.path.exists(tif_path):
-                os.remove(tif_path)
+            if os.path.exists(work_path):
+                os.remove(work_path)
             
-            # 执行格式转换
-            translate_cmd = (
-                f'gdal_translate -of GTiff '  # 输出为GeoTIFF格式
-                f'-co "COMPRESS=LZW" '  # 使用LZW压缩
-                f'-co "TILED=YES" '  # 启用分块
-                f'-co "BIGTIFF=IF_NEEDED" '  # 支持大文件
-                f'"{img_path}" "{tif_path}"'
-            )
-            subprocess.run(translate_cmd, shell=True, check=True)
+            # 后续步骤复用返回的数据集句柄
+            # 使用Translate生成VRT，会一并复制RPC等元数据域（BuildVRT不保留RPC，RPC校正会失败）
+            dataset = gdal.Translate(work_path, img_path, format='VRT')
+            if not dataset:
+                raise ValueError('无法打开影像文件')
+            dataset.FlushCache()  # 确保VRT写入磁盘，供缩略图线程和gdal2tiles子进程读取
 
             # RPC模型处理
             if has_rpc:
@@ -601,85 +1080,43 @@ class Command(BaseCommand):
                     
                 try:
                     # 执行RPC校正和投影变换
-                    warp_cmd = (
-                        f'gdalwarp -r bilinear '  # 双线性重采样
-                        f'-t_srs EPSG:4326 '  # 输出为WGS84坐标系
-                        f'-rpc '  # 启用RPC模型
-                        f'-order 1 '  # 一次多项式变换
-                        f'-et 0.5 '  # 误差阈值
-                        f'-co "COMPRESS=LZW" '
-                        f'-co "TILED=YES" '
-                        f'-co "BIGTIFF=IF_NEEDED" '
-                        f'"{tif_path}" "{warp_path}"'
+                    warped = gdal.Warp(
+                        warp_path, dataset,
+                        dstSRS='EPSG:4326',  # 输出为WGS84坐标系
+                        resampleAlg='bilinear',  # 双线性重采样
+                        rpc=True,  # 启用RPC模型
+                        polynomialOrder=1,  # 一次多项式变换
+                        errorThreshold=0.5,  # 误差阈值
+                        format='COG',
+                        creationOptions=COG_CREATION_OPTIONS
                     )
+                    warped.FlushCache()
                     
-                    # 执行变换命令
-                    result = subprocess.run(warp_cmd, shell=True, check=True,
-                                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                         universal_newlines=True)
-                    
-                    if result.stderr:
-                        logger.warning(f"Warp警告: {result.stderr}")
-                    
-                    # 使用变换后的文件
-                    if os.path.exists(warp_path):
-                        os.replace(warp_path, tif_path)
-                        logger.info("完成RPC坐标转换")
-                        
-                        # 验证转换结果
-                        ds = gdal.Open(tif_path)
-                        if ds:
-                            gt = ds.GetGeoTransform()
-                            logger.info(f"转换后的地理变换参数: {gt}")
-                            ds = None
+                    # 使用变换后的数据集，原始VRT不再需要
+                    vrt_path = work_path
+                    dataset = warped
+                    work_path = warp_path
+                    logger.info("完成RPC坐标转换")
+                    logger.info(f"转换后的地理变换参数: {dataset.GetGeoTransform()}")
+                    try:
+                        os.remove(vrt_path)
+                    except OSError as e:
+                        logger.warning(f"临时文件删除失败 {vrt_path}: {str(e)}")
                 except Exception as e:
+                    # 未经RPC校正的影像没有有效的地理范围，不能入库
                     logger.error(f"RPC坐标转换失败: {str(e)}")
-                    if os.path.exists(warp_path):
-                        os.remove(warp_path)
-                    logger.warning("使用原始文件继续处理")
-
-            # 打开转换后的TIFF文件
-            dataset = gdal.Open(tif_path)
-            if not dataset:
-                raise ValueError('无法打开TIFF文件')
+                    dataset = None
+                    for path in (warp_path, work_path):
+                        if os.path.exists(path):
+                            os.remove(path)
+                    raise ValueError(f'RPC坐标转换失败: {str(e)}') from e
 
             try:
                 # 坐标系验证和处理
-                src_srs = osr.SpatialReference()
-                projection = dataset.GetProjection()
-                
-                if not projection:
-                    # 尝试从ENVI头文件读取投影信息
-                    logger.warning("GDAL未检测到投影信息，尝试从ENVI头文件读取...")
-                    try:
-                        with open(hdr_path, 'r') as f:
-                            header_content = f.read()
-                            
-                        # 检查map info信息
-                        if 'map info' in header_content.lower():
-                            logger.info("从ENVI头文件中检测到map info")
-                            map_info_start = header_content.find('map info = {')
-                            if map_info_start != -1:
-                                map_info_end = header_content.find('}', map_info_start)
-                                map_info = header_content[map_info_start:map_info_end+1]
-                                logger.info(f"Map info: {map_info}")
-                                src_srs.ImportFromEPSG(4326)  # 使用WGS84
-                        else:
-                            logger.warning("在ENVI头文件中也未找到投影信息，使用默认WGS84")
-                            src_srs.ImportFromEPSG(4326)
-                    except Exception as e:
-                        logger.error(f"读取ENVI头文件失败: {str(e)}")
-                        src_srs.ImportFromEPSG(4326)
-                else:
-                    try:
-                        src_srs.ImportFromWkt(projection)
-                    except Exception as e:
-                        logger.error(f"解析投影信息失败: {str(e)}，使用默认WGS84")
-                        src_srs.ImportFromEPSG(4326)
+                src_srs = self._resolve_source_srs(dataset, header['map_info'])
                 
-                # 创建目标坐标系（WGS84）
-                tgt_srs = osr.SpatialReference()
-                tgt_srs.ImportFromEPSG(4326)
+                # 目标坐标系（WGS84）
+                tgt_srs = _get_wgs84()
                 
                 # 获取坐标系信息
                 coordinate_system = src_srs.GetName() if src_srs.GetName() else 'WGS84'
@@ -695,172 +1132,23 @@ class Command(BaseCommand):
                 os.makedirs(thumbnail_dir, exist_ok=True)
                 thumbnail_path = os.path.join(thumbnail_dir, f'{basename}_thumb.png')
 
-                # 检查数据集信息
-                band_count = dataset.RasterCount
-                logger.info(f"数据集波段数量: {band_count}")
-                logger.info(f"检测到的传感器类型: {sensor_type}")
-                
-                # 根据传感器类型选择波段组合
-                if sensor_type == 'GF5':
-                    # GF5高光谱数据
-                    red_band = 29    # ~630nm
-                    green_band = 20  # ~550nm
-                    blue_band = 11   # ~450nm
-                    scale_params = "0 2000 0 255"
-                elif sensor_type == 'PRISMA':
-                    # PRISMA高光谱数据
-                    red_band = 29    # ~630nm
-                    green_band = 20  # ~550nm
-                    blue_band = 11   # ~450nm
-                    scale_params = "0 4000 0 255"
-                elif sensor_type == 'ASTER':
-                    # ASTER VNIR波段
-                    red_band = 3     # Band 2 (Red, 0.661μm)
-                    green_band = 2  # Band 1 (Green, 0.556μm)
-                    blue_band = 1    # Band 1 (代替蓝色波段)
-
-                    # 获取数据范围
-                    ds = gdal.Open(tif_path)
-                    try:
-                        band1 = ds.GetRasterBand(1)
-                        band2 = ds.GetRasterBand(2)
-                        stats1 = band1.GetStatistics(True, True)
-                        stats2 = band2.GetStatistics(True, True)
-                        min_val = min(stats1[0], stats2[0])
-                        max_val = max(stats1[1], stats2[1])
-                        scale_params = f"{min_val} {max_val} 0 255"
-                        logger.info(f"ASTER数据范围: {scale_params}")
-                    except Exception as e:
-                        logger.warning(f"获取数据范围失败: {str(e)}, 使用默认范围")
-                        scale_params = "0 255 0 255"
-                    finally:
-                        ds = None
-                else:
-                    # Sentinel-2标准RGB波段
-                    red_band = 4    # Band 4 (Red)
-                    green_band = 3  # Band 3 (Green)
-                    blue_band = 2   # Band 2 (Blue)
-                    scale_params = "0 4000 0 255"
-
-                logger.info(f"使用波段: 红={red_band}, 绿={green_band}, 蓝={blue_band}")
-                
-                # 创建VRT文件用于波段组合
-                vrt_path = os.path.join(settings.BASE_DIR, 'static', 'temp', f'{basename}_thumb.vrt')
-                
-                try:
-                    # 创建VRT文件
-                    vrt_cmd = (
-                        f'gdalbuildvrt -separate '
-                        f'-b {red_band} -b {green_band} -b {blue_band} '
-                        f'"{vrt_path}" "{tif_path}"'
+                # 缩略图与瓦片互不依赖，在后台线程中生成缩略图
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    thumb_future = executor.submit(
+                        _make_thumbnail, work_path, thumbnail_path, sensor_type
                     )
-                    logger.info(f"执行VRT命令: {vrt_cmd}")
-                    subprocess.run(vrt_cmd, shell=True, check=True,
-                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                universal_newlines=True)
-                    
-                    # 验证VRT文件
-                    if not os.path.exists(vrt_path):
-                        raise Exception("VRT文件创建失败")
-                    
-                    # 根据传感器类型选择缩略图生成参数
-                    if sensor_type == 'ASTER':
-                        # ASTER数据使用最近邻重采样
-                        translate_cmd = (
-                            f'gdal_translate -of PNG -ot Byte '
-                            f'-outsize 256 256 '
-                            f'-scale {scale_params} '
-                            f'-r near '  # 最近邻重采样
-                            f'-a_nodata 0 '  # 设置无数据值
-                            f'"{vrt_path}" "{thumbnail_path}"'
-                        )
-                        logger.info("使用ASTER专用参数生成缩略图")
-                    
-                    elif sensor_type == 'PRISMA':
-                        # PRISMA数据使用平均值重采样
-                        translate_cmd = (
-                            f'gdal_translate -of PNG -ot Byte '
-                            f'-outsize 256 256 '
-                            f'-scale {scale_params} '
-                            f'-r average '  # 平均值重采样
-                            f'-a_nodata 0 '
-                            f'"{vrt_path}" "{thumbnail_path}"'
-                        )
-                        logger.info("使用PRISMA专用参数生成缩略图")
-                    
-                    elif sensor_type == 'GF5':
-                        # GF5数据使用双线性重采样
-                        translate_cmd = (
-                            f'gdal_translate -of PNG -ot Byte '
-                            f'-outsize 256 256 '
-                            f'-scale {scale_params} '
-                            f'-r bilinear '  # 双线性重采样
-                            f'-a_nodata 0 '
-                            f'"{vrt_path}" "{thumbnail_path}"'
-                        )
-                        logger.info("使用GF5专用参数生成缩略图")
-                    
-                    else:
-                        # Sentinel-2等数据使用标准参数
-                        translate_cmd = (
-                            f'gdal_translate -of PNG -ot Byte '
-                            f'-outsize 256 256 '
-                            f'-scale {scale_params} '
-                            f'-r bilinear '  # 双线性重采样
-                            f'"{vrt_path}" "{thumbnail_path}"'
-                        )
-                        logger.info("使用标准参数生成缩略图")
-
-                    # 执行缩略图生成
-                    result = subprocess.run(translate_cmd, shell=True, check=True,
-                                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                         universal_newlines=True)
-                    
-                    if result.stderr:
-                        logger.warning(f"转换警告: {result.stderr}")
-                    
-                    # 验证缩略图生成
-                    if not os.path.exists(thumbnail_path):
-                        raise Exception("缩略图生成失败")
-                    
-                except subprocess.CalledProcessError as e:
-                    logger.error(f"命令执行失败: {e.stderr}")
-                    raise
-                except Exception as e:
-                    logger.error(f"缩略图生成过程出错: {str(e)}")
-                    raise
-                finally:
-                    # 清理临时VRT文件
-                    if os.path.exists(vrt_path):
-                        try:
-                            os.remove(vrt_path)
-                        except Exception as e:
-                            logger.warning(f"清理VRT文件失败: {str(e)}")
 
-                # 获取数据基本信息
-                resolution = dataset.GetGeoTransform()[1]  # 空间分辨率
-                bounds = self.calculate_bounds(dataset)  # 数据范围
-                tile_url = self.generate_tiles(tif_path, basename)  # 生成瓦片
+                    # 获取数据基本信息
+                    resolution = dataset.GetGeoTransform()[1]  # 空间分辨率
+                    bounds = self.calculate_bounds(dataset, src_srs)  # 数据范围
+                    tile_url = self.generate_tiles(dataset, basename, sensor_type)  # 生成瓦片
+
+                    thumb_future.result()  # 缩略图生成失败时在此抛出异常
 
                 # 准备波段描述信息
                 if sensor_type == 'ASTER':
                     # ASTER标准波段描述
-                    band_descriptions = [
-                        'VNIR Band 1 (Green)',
-                        'VNIR Band 2 (Red)',
-                        'VNIR Band 3N (NIR)',
-                        'SWIR Band 4',
-                        'SWIR Band 5',
-                        'SWIR Band 6',
-                        'SWIR Band 7',
-                        'SWIR Band 8',
-                        'SWIR Band 9',
-                        'TIR Band 10',
-                        'TIR Band 11',
-                        'TIR Band 12',
-                        'TIR Band 13',
-                        'TIR Band 14'
-                    ]
+                    band_descriptions = list(_ASTER_BANDS)
                 elif sensor_type in ['GF5', 'PRISMA']:
                     # 高光谱数据使用波长信息
                     if wavelength_info and 'wavelengths' in wavelength_info:
@@ -872,21 +1160,7 @@ class Command(BaseCommand):
                         band_descriptions = [f'Band {i+1}' for i in range(dataset.RasterCount)]
                 else:
                     # Sentinel-2标准波段描述
-                    band_descriptions = [
-                        'Band 1 - Coastal aerosol',
-                        'Band 2 - Blue',
-                        'Band 3 - Green',
-                        'Band 4 - Red',
-                        'Band 5 - Vegetation Red Edge',
-                        'Band 6 - Vegetation Red Edge',
-                        'Band 7 - Vegetation Red Edge',
-                        'Band 8 - NIR',
-                        'Band 8A - Vegetation Red Edge',
-                        'Band 9 - Water vapour',
-                        'Band 10 - SWIR/Cirrus',
-                        'Band 11 - SWIR',
-                        'Band 12 - SWIR'
-                    ]
+                    band_descriptions = list(_S2_BANDS)
                     # 处理波段数不匹配的情况
                     if len(band_descriptions) != dataset.RasterCount:
                         band_descriptions = [f'Band {i+1}' for i in range(dataset.RasterCount)]
@@ -897,21 +1171,21 @@ class Command(BaseCommand):
                     
                     # 解析获取日期
                     acquisition_date = None
-                    parts = basename.split('_')
-                    for part in parts:
-                        if len(part) >= 8 and part[:8].isdigit():
-                            try:
-                                acquisition_date = datetime.strptime(part[:8], '%Y%m%d').date()
-                                break
-                            except ValueError:
-                                continue
+                    for match in _DATE_RE.finditer(basename):
+                        digits = match.group(1)
+                        try:
+                            # 直接按位截取年月日，非法日期由date()抛出ValueError
+                            acquisition_date = date(int(digits[:4]), int(digits[4:6]), int(digits[6:8]))
+                            break
+                        except ValueError:
+                            continue
                     
                     if not acquisition_date:
                         logger.warning(f"无法从文件名解析日期，使用当前日期")
                         acquisition_date = datetime.now().date()
                     
                     # 创建或更新数据记录
-                    EnviData.objects.update_or_create(
+                    envi_data, _ = EnviData.objects.update_or_create(
                         name=basename,
                         defaults={
                             'file_path': hdr_path,
@@ -923,36 +1197,38 @@ class Command(BaseCommand):
                             'tile_url': tile_url,
                             'coordinate_system': coordinate_system,
                             'thumbnail': f'thumbnails/{basename}_thumb.png',
-                            'bands_info': json.dumps({
+                            'bands_info': {
                                 'count': dataset.RasterCount,
                                 'descriptions': band_descriptions[:dataset.RasterCount]
-                            }),
-                            'wavelength_info': json.dumps(wavelength_info) if wavelength_info else None
+                            },
+                            'wavelength_info': wavelength_info or None
                         }
                     )
+                    self.envi_data_id = envi_data.pk
 
             finally:
                 # 清理资源
                 if dataset:
+                    _forget_aster_range(dataset)
                     dataset.FlushCache()
                     dataset = None
 
-                # 清理GDAL驱动
-                for i in reversed(range(gdal.GetDriverCount())):
-                    drv = gdal.GetDriver(i)
-                    if drv is not None:
-                        try:
-                            drv.Deregister()
-                        except Exception as e:
-                            logger.warning(f'驱动清理失败: {str(e)}')
+                # 清理GDAL网络读取缓存（驱动保持注册，同一进程中的后续调用可直接复用）
+                gdal.VSICurlClearCache()
 
-                # 清理临时文件
-                if os.path.exists(tif_path):
+                # 清理临时文件（GDAL可能短暂持有句柄，进程内退避重试）
+                for attempt in range(UNLINK_RETRIES):
                     try:
-                        os.remove(tif_path)
-                    except PermissionError as pe:
-                        self.stdout.write(self.style.WARNING(f'文件删除重试: {tif_path}'))
-                        subprocess.run(f'timeout 5 /C "del /F /Q "{tif_path}""', shell=True)
+                        os.unlink(work_path)
+                        break
+                    except FileNotFoundError:
+                        break
+                    except PermissionError:
+                        if attempt == 0:
+                            self.stdout.write(self.style.WARNING(f'文件删除重试: {work_path}'))
+                        time.sleep(UNLINK_RETRY_DELAY * (attempt + 1))
+                else:
+                    logger.warning(f'临时文件删除失败: {work_path}')
 
         except Exception as e:
             logger.error(f'处理失败: {str(e)}')
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from geodata.models import EnviFile
+from geodata.utils import EnviProcessor
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 上传后超过该时间（分钟）仍处于"处理中"的记录，视为后台任务已丢失（如服务重启）
+STALE_MINUTES = 120
+
+class Command(BaseCommand):
+    help = '重新处理或标记后台任务丢失而一直处于处理中的上传文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=STALE_MINUTES,
+            help=f'只处理上传时间早于该分钟数的记录（默认{STALE_MINUTES}）'
+        )
+        parser.add_argument(
+            '--mark-failed', action='store_true',
+            help='只将记录标记为处理失败，不重新处理'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options['older_than'])
+        stale = EnviFile.objects.filter(status=EnviFile.STATUS_PENDING, upload_date__lt=cutoff)
+
+        if options['mark_failed']:
+            count = stale.update(status=EnviFile.STATUS_FAILED)
+            logger.info(f'已将 {count} 条滞留的上传记录标记为处理失败')
+            self.stdout.write(self.style.SUCCESS(f'完成! 共标记 {count} 条记录为处理失败'))
+            return
+
+        envi_files = list(stale)
+        self.stdout.write(f'发现 {len(envi_files)} 条滞留的上传记录')
+
+        success_count = 0
+        for envi_file in envi_files:
+            # 在当前进程中同步处理，结果由process_single_file写入状态
+            result = EnviProcessor.process_single_file(envi_file)
+            if result['status'] == 'success':
+                success_count += 1
+                self.stdout.write(self.style.SUCCESS(f'处理成功: {envi_file.name}'))
+            else:
+                self.stdout.write(self.style.ERROR(f'处理失败 {envi_file.name}: {result["message"]}'))
+
+        self.stdout.write('\n处理完成!')
+        self.stdout.write(f'成功: {success_count}')
+        self.stdout.write(f'失败: {len(envi_files) - success_count}')
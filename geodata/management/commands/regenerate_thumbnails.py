@@ -1,147 +1,228 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
 from geodata.models import EnviData, EnviFile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import os
-import subprocess
 import logging
+import django
 from osgeo import gdal, osr
 
 logger = logging.getLogger(__name__)
 
+# 批量更新数据库记录的批次大小
+BATCH_SIZE = 500
+
+# 进度输出的缓冲条数，攒够后一次性写入终端
+OUTPUT_BUFFER_SIZE = 100
+
+# 缩略图边长（像素），概览构建到不小于该尺寸的最粗一级为止
+THUMBNAIL_SIZE = 256
+
+# 每个工作进程的GDAL块缓存大小（字节），避免多进程叠加占用内存
+GDAL_CACHE_MAX = 64 << 20
+
+
+def _configure_gdal():
+    """配置GDAL环境"""
+    proj_path = r'D:\Anaconda3\envs\envi_web\Library\share\proj'
+    gdal_path = r'D:\Anaconda3\envs\envi_web\Library\share\gdal'
+    bin_path = r'D:\Anaconda3\envs\envi_web\Library\bin'
+
+    os.environ.update({
+        'PROJ_LIB': proj_path,
+        'GDAL_DATA': gdal_path,
+        'PATH': f"{bin_path};{os.environ['PATH']}"
+    })
+
+    gdal.SetConfigOption('GDAL_DATA', gdal_path)
+    gdal.SetConfigOption('PROJ_LIB', proj_path)
+    gdal.SetConfigOption('COMPRESS_OVERVIEW', 'DEFLATE')  # 外部概览压缩
+    gdal.SetConfigOption('GDAL_TIFF_OVR_BLOCKSIZE', '128')  # 概览块大小，缩略图读取量更小
+    os.environ['GDAL_CACHEMAX'] = str(GDAL_CACHE_MAX >> 20)  # 单位MB
+    gdal.SetCacheMax(GDAL_CACHE_MAX)
+    gdal.AllRegister()
+    gdal.UseExceptions()
+
+
+def _worker_init():
+    """工作进程初始化：加载Django配置并配置GDAL，每个进程只执行一次"""
+    django.setup()
+    _configure_gdal()
+
+
+def _ensure_overviews(dataset):
+    """
+    源数据没有概览时构建外部概览（.ovr）
+
+    以只读方式打开的数据集会将概览写入同名.ovr文件，不修改原始数据。
+    之后生成缩略图时GDAL自动选择最接近目标尺寸的概览层读取，无需读取全分辨率数据。
+
+    Args:
+        dataset: 已打开的GDAL数据集
+    """
+    if dataset.GetRasterBand(1).GetOverviewCount() > 0:
+        return
+    levels = []
+    factor = 2
+    while min(dataset.RasterXSize, dataset.RasterYSize) // factor >= THUMBNAIL_SIZE:
+        levels.append(factor)
+        factor *= 2
+    if levels:
+        dataset.BuildOverviews('AVERAGE', levels)
+
+
+def _process_one(data_id, build_overviews=False):
+    """
+    为单条遥感数据记录重新生成缩略图
+
+    在工作进程中执行，按主键重新查询记录，避免在进程间传递模型对象。
+
+    Args:
+        data_id: EnviData记录ID
+        build_overviews: 是否为缺少概览的源数据构建外部概览
+
+    Returns:
+        tuple: (记录ID, 记录名称, 错误信息)，成功时错误信息为None
+    """
+    try:
+        # 一并JOIN取出关联的ENVI文件，只读取生成缩略图所需的字段
+        data = EnviData.objects.select_related('envi_file').only(
+            'id', 'name', 'file_path', 'envi_file__img_file'
+        ).get(pk=data_id)
+    except EnviData.DoesNotExist:
+        return data_id, f'ID{data_id}', '记录不存在'
+    basename = data.name
+    thumbnail_dir = os.path.join(settings.BASE_DIR, 'media', 'thumbnails')
+
+    try:
+        # 获取IMG文件路径
+        if data.envi_file and data.envi_file.img_file:
+            img_path = data.envi_file.img_file.path
+        else:
+            img_path = data.file_path.replace('.hdr', '.img')
+
+        # 生成新的缩略图
+        thumbnail_path = os.path.join(thumbnail_dir, f'{basename}_thumb.png')
+
+        # 步骤1: 由ENVI驱动直接读取原始数据，不再转换为中间TIFF文件
+        dataset = gdal.Open(img_path)
+        if not dataset:
+            raise Exception("无法打开IMG文件")
+
+        try:
+            # 确保有足够的波段
+            if dataset.RasterCount < 4:
+                raise Exception(f"波段数量不足: {dataset.RasterCount}")
+
+            if build_overviews:
+                _ensure_overviews(dataset)
+
+            # 步骤2: 从已打开的数据集直接选取波段生成缩略图，无需中间VRT文件
+            # 使用正确的波段顺序：4(红),3(绿),2(蓝)
+            # 对于Sentinel-2 L2A数据，反射率通常在0-10000范围内
+            gdal.Translate(
+                thumbnail_path, dataset,
+                format='PNG',
+                outputType=gdal.GDT_Byte,
+                width=THUMBNAIL_SIZE, height=THUMBNAIL_SIZE,
+                bandList=[4, 3, 2],  # 指定波段顺序：红绿蓝
+                scaleParams=[[0, 4000, 0, 255]] * 3,
+                resampleAlg='average'  # 大比例缩小时平均值重采样抗锯齿效果更好
+            )
+
+        finally:
+            # 清理资源
+            dataset = None
+
+        # 数据库记录由主进程批量更新
+        return data_id, basename, None
+
+    except Exception as e:
+        logger.error(f'缩略图生成失败 {basename}: {str(e)}', exc_info=True)
+        return data_id, basename, str(e)
+
+
 class Command(BaseCommand):
     help = '重新生成所有遥感数据的缩略图'
 
-    def _configure_gdal(self):
-        """配置GDAL环境"""
-        proj_path = r'D:\Anaconda3\envs\envi_web\Library\share\proj'
-        gdal_path = r'D:\Anaconda3\envs\envi_web\Library\share\gdal'
-        bin_path = r'D:\Anaconda3\envs\envi_web\Library\bin'
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count() or 1,
+            help='并行处理的进程数（默认为CPU核心数）'
+        )
+        parser.add_argument(
+            '--build-overviews', action='store_true',
+            help='为缺少概览的源数据构建外部概览（.ovr），后续重新生成时只需读取概览层'
+        )
 
-        os.environ.update({
-            'PROJ_LIB': proj_path,
-            'GDAL_DATA': gdal_path,
-            'PATH': f"{bin_path};{os.environ['PATH']}"
-        })
+    def handle(self, *args, **options):
+        _configure_gdal()
 
-        gdal.SetConfigOption('GDAL_DATA', gdal_path)
-        gdal.SetConfigOption('PROJ_LIB', proj_path)
-        gdal.AllRegister()
-        gdal.UseExceptions()
+        # 获取所有EnviData记录ID
+        ids = list(EnviData.objects.values_list('id', flat=True))
+        total = len(ids)
 
-    def handle(self, *args, **options):
-        self._configure_gdal()
-        
-        # 获取所有EnviData记录
-        envi_data_records = EnviData.objects.all()
-        total = envi_data_records.count()
-        
         self.stdout.write(f'开始处理 {total} 条记录的缩略图...')
-        
-        # 创建缩略图目录
+
         thumbnail_dir = os.path.join(settings.BASE_DIR, 'media', 'thumbnails')
+
+        # 清理现有缩略图（目录不存在时无需清理）
+        if os.path.isdir(thumbnail_dir):
+            with os.scandir(thumbnail_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.png') and entry.is_file(follow_symlinks=False):
+                        try:
+                            os.unlink(entry.path)
+                        except OSError as e:
+                            self.stdout.write(self.style.WARNING(f'删除文件失败 {entry.name}: {str(e)}'))
+
+        # 创建缩略图目录
         os.makedirs(thumbnail_dir, exist_ok=True)
-        
-        # 清理现有缩略图
-        for file in os.listdir(thumbnail_dir):
-            if file.endswith('.png'):
-                try:
-                    os.remove(os.path.join(thumbnail_dir, file))
-                except Exception as e:
-                    self.stdout.write(self.style.WARNING(f'删除文件失败 {file}: {str(e)}'))
 
         success_count = 0
         error_count = 0
-        
-        for i, data in enumerate(envi_data_records, 1):
-            self.stdout.write(f'处理第 {i}/{total} 条记录: {data.name}')
-            
-            try:
-                # 创建临时TIFF文件
-                basename = data.name
-                tif_path = os.path.join(settings.BASE_DIR, 'static', 'temp', f'{basename}.tif')
-                os.makedirs(os.path.dirname(tif_path), exist_ok=True)
-                
-                # 获取IMG文件路径
-                if data.envi_file and data.envi_file.img_file:
-                    img_path = data.envi_file.img_file.path
+        updated = []
+        output = []
+
+        # 关闭当前数据库连接，避免工作进程继承同一连接
+        connections.close_all()
+
+        processes = max(1, options['processes'])
+        with ProcessPoolExecutor(max_workers=processes, initializer=_worker_init) as executor:
+            for i, (data_id, basename, error) in enumerate(executor.map(
+                partial(_process_one, build_overviews=options['build_overviews']), ids, chunksize=4
+            ), 1):
+                output.append(f'处理第 {i}/{total} 条记录: {basename}')
+                if error is None:
+                    success_count += 1
+                    updated.append(EnviData(
+                        id=data_id,
+                        thumbnail=f'thumbnails/{basename}_thumb.png',
+                        updated_at=timezone.now()
+                    ))
+                    output.append(self.style.SUCCESS(f'成功处理: {basename}'))
                 else:
-                    img_path = data.file_path.replace('.hdr', '.img')
-                
-                # 转换为TIFF格式
-                subprocess.run(
-                    f'gdal_translate -of GTiff "{img_path}" "{tif_path}"',
-                    shell=True,
-                    check=True
-                )
-                
-                # 生成新的缩略图
-                thumbnail_path = os.path.join(thumbnail_dir, f'{basename}_thumb.png')
-                
-                # 步骤1: 获取数据统计信息
-                dataset = gdal.Open(tif_path)
-                if not dataset:
-                    raise Exception("无法打开TIFF文件")
-                
-                try:
-                    # 确保有足够的波段
-                    if dataset.RasterCount < 4:
-                        raise Exception(f"波段数量不足: {dataset.RasterCount}")
-                    
-                    # 步骤2: 创建临时VRT文件用于波段组合
-                    vrt_path = os.path.join(settings.BASE_DIR, 'static', 'temp', f'{basename}_thumb.vrt')
-                    
-                    # 使用正确的波段顺序：4(红),3(绿),2(蓝)
-                    subprocess.run(
-                        f'gdalbuildvrt -separate '
-                        f'-b 4 -b 3 -b 2 '  # 指定波段顺序：红绿蓝
-                        f'"{vrt_path}" "{tif_path}"',
-                        shell=True,
-                        check=True
-                    )
-                    
-                    # 步骤3: 生成缩略图
-                    # 对于Sentinel-2 L2A数据，反射率通常在0-10000范围内
-                    subprocess.run(
-                        f'gdal_translate -of PNG -ot Byte '
-                        f'-outsize 256 256 '
-                        f'-scale_1 0 4000 0 255 '  # 红波段
-                        f'-scale_2 0 4000 0 255 '  # 绿波段
-                        f'-scale_3 0 4000 0 255 '  # 蓝波段
-                        f'-r bilinear '
-                        f'"{vrt_path}" "{thumbnail_path}"',
-                        shell=True,
-                        check=True
-                    )
-                    
-                finally:
-                    # 清理资源
-                    dataset = None
-                    if os.path.exists(vrt_path):
-                        os.remove(vrt_path)
-                
-                # 更新数据库记录
-                data.thumbnail = f'thumbnails/{basename}_thumb.png'
-                data.save()
-                
-                success_count += 1
-                self.stdout.write(self.style.SUCCESS(f'成功处理: {basename}'))
-                
-            except Exception as e:
-                error_count += 1
-                self.stdout.write(self.style.ERROR(f'处理失败 {basename}: {str(e)}'))
-                logger.error(f'缩略图生成失败 {basename}: {str(e)}', exc_info=True)
-            
-            finally:
-                # 清理临时文件
-                if os.path.exists(tif_path):
-                    try:
-                        os.remove(tif_path)
-                    except Exception as e:
-                        logger.warning(f'临时文件删除失败 {tif_path}: {str(e)}')
-        
+                    error_count += 1
+                    output.append(self.style.ERROR(f'处理失败 {basename}: {error}'))
+
+                # 缓冲进度输出，避免每条记录多次写终端
+                if len(output) >= OUTPUT_BUFFER_SIZE:
+                    self.stdout.write('\n'.join(output))
+                    output.clear()
+
+        if output:
+            self.stdout.write('\n'.join(output))
+
+        # 批量更新缩略图路径
+        with transaction.atomic():
+            EnviData.objects.bulk_update(updated, ['thumbnail', 'updated_at'], batch_size=BATCH_SIZE)
+
         # 输出总结
         self.stdout.write('\n处理完成!')
         self.stdout.write(f'成功: {success_count}')
         self.stdout.write(f'失败: {error_count}')
         if error_count > 0:
-            self.stdout.write(self.style.WARNING('请检查日志获取详细错误信息')) 
\ No newline at end of file
+            self.stdout.write(self.style.WARNING('请检查日志获取详细错误信息'))
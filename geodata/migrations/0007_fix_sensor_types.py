@@ -2,13 +2,9 @@ from django.db import migrations
 
 def fix_sensor_types(apps, schema_editor):
     EnviData = apps.get_model('geodata', 'EnviData')
-    for data in EnviData.objects.all():
-        # 根据文件名判断传感器类型
-        if data.name.startswith('S2'):
-            data.sensor_type = 'S2'
-        elif data.name.startswith('GF5'):
-            data.sensor_type = 'GF5'
-        data.save()
+    # 根据文件名判断传感器类型，每种类型一条UPDATE语句
+    EnviData.objects.filter(name__startswith='S2').update(sensor_type='S2')
+    EnviData.objects.filter(name__startswith='GF5').update(sensor_type='GF5')
 
 def reverse_migration(apps, schema_editor):
     pass
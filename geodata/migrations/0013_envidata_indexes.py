@@ -0,0 +1,25 @@
+# Generated by Django 4.2.19 on 2026-10-15 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("geodata", "0012_workstation_workstationfile"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="envidata",
+            name="acquisition_date",
+            field=models.DateField(db_index=True, verbose_name="获取时间"),
+        ),
+        migrations.AddIndex(
+            model_name="envidata",
+            index=models.Index(
+                fields=["sensor_type", "acquisition_date"],
+                name="envidata_sensor_date_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+import json
+
+from django.db import migrations
+
+# 批量更新的批次大小
+BATCH_SIZE = 500
+
+
+def decode_json_strings(apps, schema_editor):
+    """将以JSON字符串形式保存的波段信息和波长信息转换为原生JSON值"""
+    EnviData = apps.get_model('geodata', 'EnviData')
+    batch = []
+    records = EnviData.objects.only('id', 'bands_info', 'wavelength_info')
+    for record in records.iterator(chunk_size=BATCH_SIZE):
+        changed = False
+        if isinstance(record.bands_info, str):
+            record.bands_info = json.loads(record.bands_info)
+            changed = True
+        if isinstance(record.wavelength_info, str):
+            record.wavelength_info = json.loads(record.wavelength_info)
+            changed = True
+        if changed:
+            batch.append(record)
+        if len(batch) >= BATCH_SIZE:
+            EnviData.objects.bulk_update(batch, ['bands_info', 'wavelength_info'])
+            batch.clear()
+    if batch:
+        EnviData.objects.bulk_update(batch, ['bands_info', 'wavelength_info'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geodata', '0013_envidata_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(decode_json_strings, migrations.RunPython.noop),
+    ]
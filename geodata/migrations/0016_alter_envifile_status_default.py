@@ -0,0 +1,27 @@
+# Generated by Django 4.2.19 on 2026-10-15 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("geodata", "0015_envifile_status"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="envifile",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "处理中"),
+                    ("ready", "已完成"),
+                    ("failed", "处理失败"),
+                ],
+                default="ready",
+                max_length=10,
+                verbose_name="处理状态",
+            ),
+        ),
+    ]
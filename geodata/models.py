@@ -1,12 +1,47 @@
 from django.contrib.gis.db import models  # GeoDjango模型
 from django.utils import timezone  # 时区工具
 from django.core.files.storage import FileSystemStorage  # 文件存储
+from django.db.models.signals import post_save, post_delete  # 模型保存/删除信号
+from django.core.cache import cache  # Django缓存框架
+from django.dispatch import receiver  # 信号接收器装饰器
 import os  # 操作系统接口
+import time  # 时间戳
+
+# 地图GeoJSON缓存版本号在缓存中的键，数据变化时递增
+GEOJSON_VERSION_KEY = 'envi_geojson:version'
+
+def geojson_cache_version():
+    """返回地图GeoJSON缓存的当前版本号"""
+    version = cache.get(GEOJSON_VERSION_KEY)
+    if version is None:
+        # 以纳秒时间戳初始化，缓存被清空后也不会与旧版本号重复
+        cache.add(GEOJSON_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(GEOJSON_VERSION_KEY, 0)
+    return version
+
+def invalidate_geojson_cache():
+    """遥感数据或其关联变化后调用，使地图GeoJSON缓存失效
+    update()、bulk_update()和原生SQL不会触发模型信号，需在写入后手动调用；
+    版本号只在共享缓存（CACHE_SHARED）下使用，进程内缓存按数据的最近更新时间判断，
+    这类写入还需同时刷新updated_at
+    """
+    try:
+        cache.incr(GEOJSON_VERSION_KEY)
+    except ValueError:
+        cache.add(GEOJSON_VERSION_KEY, time.time_ns(), None)
+
+# 文件存在性缓存的最大条目数
+EXISTS_CACHE_SIZE = 1024
 
 class KeepNameFileStorage(FileSystemStorage):
     """自定义文件存储类
     保持原始文件名，如果文件已存在则覆盖
     """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 已确认存在的文件名，批量上传时同名文件无需重复stat
+        self._exists_cache = {}
+
     def get_valid_name(self, name):
         """保持原始文件名"""
         return name
@@ -17,6 +52,31 @@ class KeepNameFileStorage(FileSystemStorage):
             self.delete(name)
         return name
 
+    def exists(self, name):
+        """检查文件是否存在
+        只缓存"存在"的结果：过期的"存在"最多导致一次多余的删除，
+        而过期的"不存在"会让保存时的文件名冲突处理失效
+        """
+        if name in self._exists_cache:
+            return True
+        result = super().exists(name)
+        if result:
+            if len(self._exists_cache) >= EXISTS_CACHE_SIZE:
+                self._exists_cache.clear()
+            self._exists_cache[name] = True
+        return result
+
+    def delete(self, name):
+        """删除文件并清除存在性缓存"""
+        self._exists_cache.pop(name, None)
+        super().delete(name)
+
+    def _save(self, name, content):
+        """保存文件并记录其存在"""
+        name = super()._save(name, content)
+        self._exists_cache[name] = True
+        return name
+
 # 创建存储实例
 keep_name_storage = KeepNameFileStorage()
 
@@ -25,11 +85,27 @@ class EnviFile(models.Model):
     存储ENVI格式的遥感影像文件对（.hdr和.img文件）
     支持原始数据和两种蚀变分析方法的结果
     """
+    # 处理状态选项
+    STATUS_PENDING = 'pending'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, '处理中'),
+        (STATUS_READY, '已完成'),
+        (STATUS_FAILED, '处理失败'),
+    )
+
     # 基本信息
     name = models.CharField('文件名', max_length=500, blank=True)  # 文件名
     description = models.TextField('描述', blank=True)  # 文件描述
     upload_date = models.DateTimeField('上传时间', auto_now_add=True)  # 上传时间
     download_count = models.IntegerField('下载次数', default=0)  # 下载计数
+    status = models.CharField(
+        '处理状态', 
+        max_length=10, 
+        choices=STATUS_CHOICES, 
+        default=STATUS_READY
+    )  # 处理状态，单文件/批量上传时先置为处理中，后台生成瓦片后更新
     
     # 原始数据文件
     hdr_file = models.FileField(
@@ -141,7 +217,7 @@ class EnviData(models.Model):
         path='E:/graduation_bzy/data', 
         max_length=500
     )  # 文件路径
-    acquisition_date = models.DateField('获取时间')  # 获取时间
+    acquisition_date = models.DateField('获取时间', db_index=True)  # 获取时间
     
     # 空间信息
     coordinate_system = models.CharField('坐标系', max_length=500)  # 坐标系
@@ -177,6 +253,11 @@ class EnviData(models.Model):
     class Meta:
         db_table = 'geodata_envidata'  # 数据库表名
         ordering = ['-created_at']  # 按创建时间倒序排序
+        # 按传感器类型和获取时间筛选的组合索引
+        # （bounds、center_point为几何字段，GeoDjango默认已创建GiST空间索引）
+        indexes = [
+            models.Index(fields=['sensor_type', 'acquisition_date'], name='envidata_sensor_date_idx'),
+        ]
 
     def __str__(self):
         """返回影像的字符串表示"""
@@ -190,6 +271,15 @@ class EnviData(models.Model):
             self.created_at = timezone.now()
         super().save(*args, **kwargs)
 
+def ready_envi_data():
+    """返回已处理完成的遥感数据查询集
+    后台处理中或处理失败的上传不在地图、空间查询和影像信息中显示；
+    没有关联文件的数据（如通过命令行直接入库）视为已完成
+    """
+    return EnviData.objects.filter(
+        models.Q(envi_file__isnull=True) | models.Q(envi_file__status=EnviFile.STATUS_READY)
+    )
+
 class WorkStation(models.Model):
     """个人工作站模型
     用于组织和管理用户的遥感影像数据
@@ -239,4 +329,10 @@ class WorkStationFile(models.Model):
 
     def __str__(self):
         """返回关联的字符串表示"""
-        return f"{self.workstation.name} - {self.envi_file.name}"
\ No newline at end of file
+        return f"{self.workstation.name} - {self.envi_file.name}"
+
+@receiver([post_save, post_delete], sender=EnviData)
+@receiver(post_delete, sender=EnviFile)
+def invalidate_geojson_on_change(sender, **kwargs):
+    """遥感数据增删改或关联文件删除（关联置空）时使地图GeoJSON缓存失效"""
+    invalidate_geojson_cache()
@@ -1,3 +1,287 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import date, timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Polygon
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .models import EnviData, EnviFile, WorkStation
+from .utils import EnviProcessor
 
-# Create your tests here.
+# 测试用户密码
+TEST_PASSWORD = 'S3cure-Passw0rd!'
+
+def make_envi_data(name, sensor_type, lon_lat_ring, envi_file=None):
+    """创建遥感数据记录，边界按入库约定以纬度-经度顺序保存
+
+    Args:
+        name: 影像名称
+        sensor_type: 传感器类型
+        lon_lat_ring: 经度-纬度顺序的闭合坐标环
+        envi_file: 关联的EnviFile（可选）
+    """
+    bounds = Polygon([(lat, lon) for lon, lat in lon_lat_ring], srid=4326)
+    return EnviData.objects.create(
+        name=name,
+        sensor_type=sensor_type,
+        file_path=f'/data/{name}.hdr',
+        acquisition_date=date(2024, 5, 1),
+        coordinate_system='WGS 84',
+        resolution=30.0,
+        bounds=bounds,
+        center_point=bounds.centroid,
+        bands_info={},
+        thumbnail=f'thumbnails/{name}_thumb.png',
+        envi_file=envi_file,
+    )
+
+def response_content(response):
+    """读取普通或流式响应的完整内容"""
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+def box(min_lon, min_lat, max_lon, max_lat):
+    """经度-纬度顺序的矩形坐标环"""
+    return [
+        (min_lon, min_lat), (max_lon, min_lat), (max_lon, max_lat),
+        (min_lon, max_lat), (min_lon, min_lat),
+    ]
+
+class LoggedInTestCase(TestCase):
+    """已登录用户的测试基类"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', TEST_PASSWORD)
+        self.client.force_login(self.user)
+
+class MediaRootTestCase(LoggedInTestCase):
+    """使用临时媒体目录的测试基类"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def make_envi_file(self, name, **fields):
+        """创建带有HDR/IMG文件的EnviFile记录"""
+        return EnviFile.objects.create(
+            hdr_file=SimpleUploadedFile(f'{name}.hdr', b'ENVI\nbands = 4\n'),
+            img_file=SimpleUploadedFile(f'{name}.img', b'\x00' * 1024),
+            **fields
+        )
+
+class SpatialQueryResponseTests(LoggedInTestCase):
+    """空间查询响应测试"""
+
+    def _query(self, **payload):
+        return self.client.post(
+            reverse('geodata:spatial_query'), data=json.dumps(payload), content_type='application/json'
+        )
+
+    def test_returns_complete_json(self):
+        make_envi_data('S2_20240501_A', 'S2', box(100, 30, 101, 31))
+        make_envi_data('S2_20240501_B', 'S2', box(110, 30, 111, 31))
+        response = self._query(sensorTypes=['S2'])
+        self.assertEqual(response.status_code, 200)
+        names = {r['name'] for r in json.loads(response_content(response))['results']}
+        self.assertEqual(names, {'S2_20240501_A', 'S2_20240501_B'})
+
+    def test_row_error_returns_500_instead_of_dropping_rows(self):
+        """单条记录序列化失败时返回500，而不是静默跳过记录"""
+        make_envi_data('S2_20240501_A', 'S2', box(100, 30, 101, 31))
+        with mock.patch('geodata.views.json_dumps', side_effect=ValueError('boom')):
+            response = self._query()
+        self.assertEqual(response.status_code, 500)
+
+class SpatialQueryIntersectsTests(LoggedInTestCase):
+    """空间查询相交过滤测试
+
+    入库时所有传感器的边界都以纬度-经度顺序保存（GF5由swap_axes校正源数据坐标轴，
+    历史GF5记录由fix_gf5_coordinates修复），查询时交换搜索几何后由数据库完成相交判断
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.gf5 = make_envi_data('GF5_20240501_A', 'GF5', box(100, 30, 101, 31))
+        self.s2 = make_envi_data('S2_20240501_A', 'S2', box(100.5, 30.5, 101.5, 31.5))
+        self.far = make_envi_data('S2_20240501_FAR', 'S2', box(10, -40, 11, -39))
+
+    def _names(self, geometry):
+        response = self.client.post(
+            reverse('geodata:spatial_query'),
+            data=json.dumps({'geometry': geometry}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return {r['name'] for r in json.loads(response_content(response))['results']}
+
+    def test_gf5_and_s2_found_by_same_polygon(self):
+        polygon = {'type': 'Polygon', 'coordinates': [[list(p) for p in box(100.2, 30.2, 100.8, 30.8)]]}
+        self.assertEqual(self._names(polygon), {'GF5_20240501_A', 'S2_20240501_A'})
+
+    def test_polygon_outside_matches_nothing(self):
+        polygon = {'type': 'Polygon', 'coordinates': [[list(p) for p in box(50, 0, 51, 1)]]}
+        self.assertEqual(self._names(polygon), set())
+
+    def test_swapped_polygon_does_not_match(self):
+        """以纬度-经度顺序传入的搜索几何不应匹配，确认坐标顺序只交换一次"""
+        polygon = {'type': 'Polygon', 'coordinates': [[[lat, lon] for lon, lat in box(100.2, 30.2, 100.8, 30.8)]]}
+        self.assertEqual(self._names(polygon), set())
+
+class BatchDownloadTests(MediaRootTestCase):
+    """工作站批量下载（流式ZIP）测试"""
+
+    # 源文件的修改时间（ZIP时间精度为2秒，取偶数秒）
+    MTIME = time.mktime((2020, 1, 2, 3, 4, 6, 0, 0, -1))
+
+    def setUp(self):
+        super().setUp()
+        self.workstation = WorkStation.objects.create(name='测试工作站', user=self.user)
+        self.envi_file = self.make_envi_file('S2_20240501_A')
+        for field in (self.envi_file.hdr_file, self.envi_file.img_file):
+            os.utime(field.path, (self.MTIME, self.MTIME))
+
+    def _download(self, file_ids):
+        return self.client.post(reverse('geodata:batch_download'), {
+            'workstation_id': self.workstation.pk,
+            'file_ids': file_ids,
+        })
+
+    def test_archive_opens_with_names_and_mtimes(self):
+        response = self._download([str(self.envi_file.pk)])
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(response_content(response)))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(sorted(archive.namelist()), ['S2_20240501_A.hdr', 'S2_20240501_A.img'])
+        expected = time.localtime(self.MTIME)[:6]
+        for info in archive.infolist():
+            self.assertEqual(info.date_time, expected)
+        self.assertEqual(archive.read('S2_20240501_A.img'), b'\x00' * 1024)
+        self.envi_file.refresh_from_db()
+        self.assertEqual(self.envi_file.download_count, 1)
+
+    def test_empty_selection_returns_404(self):
+        response = self._download(['999999'])
+        self.assertEqual(response.status_code, 404)
+
+class ProcessEnviUploadTests(MediaRootTestCase):
+    """单文件上传（后台处理）测试"""
+
+    def test_upload_returns_202_and_status_url(self):
+        with mock.patch('geodata.views.EnviProcessor.submit') as submit, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('geodata:upload'), {
+                'hdr_file': SimpleUploadedFile('S2_20240501_A.hdr', b'ENVI\n'),
+                'img_file': SimpleUploadedFile('S2_20240501_A.img', b'\x00' * 16),
+            })
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        envi_file = EnviFile.objects.get(pk=data['file_id'])
+        self.assertEqual(envi_file.status, EnviFile.STATUS_PENDING)
+        # 事务提交后才提交后台任务
+        submit.assert_called_once_with(envi_file.pk)
+
+        status = self.client.get(data['status_url'])
+        self.assertEqual(status.status_code, 200)
+        self.assertEqual(status.json(), {'status': 'pending', 'file_id': envi_file.pk})
+
+    def test_incomplete_upload_returns_400_json(self):
+        response = self.client.post(reverse('geodata:upload'), {
+            'hdr_file': SimpleUploadedFile('S2_20240501_A.hdr', b'ENVI\n'),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+        self.assertFalse(EnviFile.objects.exists())
+
+    def test_status_of_missing_file_returns_404(self):
+        response = self.client.get(reverse('geodata:envi_file_status', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_new_files_default_to_ready(self):
+        """上传流程之外创建的文件（后台、shell）默认为已完成"""
+        self.assertEqual(self.make_envi_file('S2_20240501_B').status, EnviFile.STATUS_READY)
+
+
+# 工作线程结束时会关闭数据库连接，测试在同一连接的事务中运行，需要屏蔽
+@mock.patch('geodata.utils.connections')
+class BackgroundProcessingTests(MediaRootTestCase):
+    """后台处理状态流转测试"""
+
+    def setUp(self):
+        super().setUp()
+        self.envi_file = self.make_envi_file('S2_20240501_A', status=EnviFile.STATUS_PENDING)
+
+    def test_pending_to_ready(self, connections):
+        envi_data = make_envi_data('S2_20240501_A', 'S2', box(100, 30, 101, 31))
+        with mock.patch('geodata.utils.process_envi_file', return_value=envi_data.pk):
+            result = EnviProcessor._process_by_id(self.envi_file.pk)
+        self.assertEqual(result['status'], 'success')
+        self.envi_file.refresh_from_db()
+        self.assertEqual(self.envi_file.status, EnviFile.STATUS_READY)
+        envi_data.refresh_from_db()
+        self.assertEqual(envi_data.envi_file_id, self.envi_file.pk)
+
+    def test_pending_to_failed(self, connections):
+        with mock.patch('geodata.utils.process_envi_file', side_effect=RuntimeError('GDAL错误')):
+            result = EnviProcessor._process_by_id(self.envi_file.pk)
+        self.assertEqual(result['status'], 'error')
+        self.envi_file.refresh_from_db()
+        self.assertEqual(self.envi_file.status, EnviFile.STATUS_FAILED)
+
+    def test_missing_record(self, connections):
+        self.assertIsNone(EnviProcessor._process_by_id(999999))
+
+    def test_unready_upload_hidden_from_spatial_query(self, connections):
+        make_envi_data('S2_20240501_A', 'S2', box(100, 30, 101, 31), envi_file=self.envi_file)
+        response = self.client.post(
+            reverse('geodata:spatial_query'), data='{}', content_type='application/json'
+        )
+        self.assertEqual(json.loads(response_content(response))['results'], [])
+
+
+class RecoverPendingUploadsTests(MediaRootTestCase):
+    """滞留上传恢复命令测试"""
+
+    def setUp(self):
+        super().setUp()
+        self.stale = self.make_envi_file('S2_20240501_OLD', status=EnviFile.STATUS_PENDING)
+        self.fresh = self.make_envi_file('S2_20240501_NEW', status=EnviFile.STATUS_PENDING)
+        self.ready = self.make_envi_file('S2_20240501_OK')
+        # upload_date为auto_now_add，创建后再改为3小时前
+        EnviFile.objects.filter(pk__in=[self.stale.pk, self.ready.pk]).update(
+            upload_date=timezone.now() - timedelta(hours=3)
+        )
+
+    def _statuses(self):
+        return dict(EnviFile.objects.values_list('pk', 'status'))
+
+    def test_mark_failed(self):
+        call_command('recover_pending_uploads', older_than=60, mark_failed=True, stdout=io.StringIO())
+        self.assertEqual(self._statuses(), {
+            self.stale.pk: EnviFile.STATUS_FAILED,
+            self.fresh.pk: EnviFile.STATUS_PENDING,
+            self.ready.pk: EnviFile.STATUS_READY,
+        })
+
+    def test_reprocess_only_stale_pending(self):
+        target = 'geodata.management.commands.recover_pending_uploads.EnviProcessor.process_single_file'
+        with mock.patch(target, return_value={'status': 'success', 'message': '处理完成'}) as process:
+            call_command('recover_pending_uploads', older_than=60, stdout=io.StringIO())
+        self.assertEqual([c.args[0].pk for c in process.call_args_list], [self.stale.pk])
+
+    def test_older_than_threshold(self):
+        call_command('recover_pending_uploads', older_than=240, mark_failed=True, stdout=io.StringIO())
+        self.assertEqual(self._statuses()[self.stale.pk], EnviFile.STATUS_PENDING)
@@ -42,4 +42,6 @@ urlpatterns = [
     path('api/spatial-query/', views.spatial_query, name='spatial_query'),  # 空间查询接口
     path('api/download/<str:image_id>/', views.download_image, name='download_image'),  # 影像下载接口
     path('api/image-info/<int:image_id>/', views.image_info, name='image_info'),  # 获取影像详细信息
+    path('api/envi-files/<int:file_id>/status/', views.envi_file_status, name='envi_file_status'),  # 查询文件后台处理状态
+    path('api/tiles/<str:basename>/<int:z>/<int:x>/<int:y>.png', views.envi_tile, name='envi_tile'),  # 动态瓦片
 ]
\ No newline at end of file
@@ -1,12 +1,125 @@
 import logging  # 日志模块
-from django.core.management import call_command  # 调用Django管理命令
-from django.db import transaction  # 数据库事务
-from .models import EnviFile, EnviData  # 导入模型
-from django.db.models import Q  # 数据库查询工具
+import hashlib  # 哈希算法
+import json  # JSON序列化
+import gzip  # gzip压缩
+from .management.commands.process_envi import process_envi_file  # ENVI文件处理
+from django.db import connections, transaction  # 数据库连接和事务
+from django.db.models import Count, Max  # 聚合函数
+from django.contrib.gis.db.models.functions import AsGeoJSON  # 数据库端GeoJSON输出
+from django.conf import settings  # 项目配置
+from django.core.cache import cache  # Django缓存框架
+from django.utils import timezone  # 时区工具
+from concurrent.futures import ThreadPoolExecutor  # 线程池
+from .models import EnviFile, EnviData, geojson_cache_version, invalidate_geojson_cache, ready_envi_data  # 导入模型
+try:
+    import orjson  # 可选依赖，更快的JSON序列化
+except ImportError:
+    orjson = None
 
 # 获取logger实例
 logger = logging.getLogger(__name__)
 
+# 批量处理的最大并发数，避免磁盘读写争用
+MAX_WORKERS = 8
+
+# 后台处理单文件上传的线程数，处理在请求结束后进行，不占用Web工作进程
+BACKGROUND_WORKERS = 2
+
+# 进程内共享的后台处理线程池
+_background_executor = ThreadPoolExecutor(
+    max_workers=BACKGROUND_WORKERS, thread_name_prefix='envi-process'
+)
+
+def json_dumps(data):
+    """序列化为UTF-8编码的JSON字节串，安装了orjson时使用orjson"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False).encode()
+
+
+def json_loads(data):
+    """解析JSON字符串或字节串，安装了orjson时使用orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# 遥感数据GeoJSON缓存时间（秒），数据变化时缓存键随之改变；
+# 超时只用于兜底未通知缓存失效的写入（如数据库中直接执行的SQL）
+GEOJSON_CACHE_TIMEOUT = 3600
+# 构建GeoJSON时每次从数据库读取的记录数（PostgreSQL使用服务端游标）
+GEOJSON_CHUNK_SIZE = 500
+
+
+def _envi_data_state():
+    """查询遥感数据的记录数、已关联文件数和最近更新时间"""
+    return EnviData.objects.aggregate(
+        count=Count('id'), linked=Count('envi_file'), updated=Max('updated_at')
+    )
+
+
+def envi_data_geojson_cached():
+    """获取所有遥感数据的GeoJSON（带缓存）
+
+    使用共享缓存时，缓存按版本号保存，数据写入时由模型信号或写入方递增版本号，
+    读取时无需查询数据库即可判断缓存是否有效。
+    进程内缓存中的版本号无法通知其他工作进程，此时改为每次查询记录数、
+    已关联文件数和最近更新时间作为数据版本。
+    版本未变时直接返回缓存的序列化结果，同时缓存预先gzip压缩的结果，响应时无需每次重新压缩。
+
+    Returns:
+        tuple: (GeoJSON字节串, gzip压缩后的字节串, 数据版本, 最近更新时间)，
+            版本可用作ETag，最近更新时间可用作Last-Modified（无数据时为None）
+    """
+    if settings.CACHE_SHARED:
+        state = None
+        version = str(geojson_cache_version())
+    else:
+        state = _envi_data_state()
+        updated = state['updated'].isoformat() if state['updated'] else 'none'
+        version = hashlib.sha1(
+            f"{state['count']}:{state['linked']}:{updated}".encode()
+        ).hexdigest()
+    key = f'envi_geojson:{version}'
+
+    cached = cache.get(key)
+    if cached is None:
+        if state is None:
+            # 只在重建缓存时查询最近更新时间
+            state = _envi_data_state()
+        # 几何由数据库直接输出为GeoJSON字符串，只序列化属性后拼接，
+        # 不再逐条构建GEOS对象并解析、重新序列化几何
+        records = ready_envi_data().annotate(bounds_geojson=AsGeoJSON('bounds')).values_list(
+            'id', 'name', 'sensor_type', 'resolution', 'acquisition_date', 'tile_url',
+            'envi_file_id', 'coordinate_system', 'wavelength_info', 'bounds_geojson'
+        ).iterator(chunk_size=GEOJSON_CHUNK_SIZE)
+        features = []
+        for (data_id, name, sensor_type, resolution, acquisition_date, tile_url,
+             file_id, coordinate_system, wavelength_info, bounds_geojson) in records:
+            try:
+                properties = json_dumps({
+                    "name": name,
+                    'sensor_type': sensor_type,
+                    "resolution": resolution,
+                    "acquisition_date": acquisition_date.strftime('%Y-%m-%d'),
+                    "tile_url": tile_url,
+                    "file_id": file_id,
+                    "coordinate_system": coordinate_system,
+                    "wavelength_info": wavelength_info
+                })
+                features.append(
+                    b'{"type": "Feature", "geometry": ' + (bounds_geojson or 'null').encode()
+                    + b', "properties": ' + properties + b'}'
+                )
+            except Exception as e:
+                logger.error(f'要素序列化失败 ID{data_id}: {str(e)}')
+                continue
+
+        payload = b'{"type": "FeatureCollection", "features": [' + b', '.join(features) + b']}'
+        cached = (payload, gzip.compress(payload, compresslevel=6), state['updated'])
+        cache.set(key, cached, GEOJSON_CACHE_TIMEOUT)
+    return cached[0], cached[1], version, cached[2]
+
 class EnviProcessor:
     """ENVI文件处理工具类
     提供ENVI文件的处理功能，包括：
@@ -29,43 +142,72 @@ class EnviProcessor:
                 - envi_data_id: 成功时返回关联的EnviData ID
         """
         try:
-            # 使用事务确保数据一致性
+            logger.info(f"开始处理文件: {envi_file.name} (ID: {envi_file.id})")
+
+            # 在当前进程中处理文件并生成瓦片，返回本次写入的EnviData记录ID
+            # （批量处理时多个文件并发入库，不能按“最新未关联记录”查找）
+            # 耗时的GDAL处理不放在事务内，避免长时间占用数据库事务
+            envi_data_id = process_envi_file(envi_file.hdr_file.path, envi_file.img_file.path)
+
+            # 使用事务确保关联和状态更新一致
             with transaction.atomic():
-                logger.info(f"开始处理文件: {envi_file.name} (ID: {envi_file.id})")
-                
-                # 记录处理前的所有已关联的EnviData记录ID
-                existing_ids = set(EnviData.objects.filter(
-                    ~Q(envi_file=None)
-                ).values_list('id', flat=True))
-                
-                # 调用Django管理命令处理文件并生成瓦片
-                call_command('process_envi', envi_file.hdr_file.path, envi_file.img_file.path)
-                
-                # 获取处理后新创建的未关联的EnviData记录
-                new_envi_data = EnviData.objects.filter(
-                    Q(envi_file=None) | ~Q(id__in=existing_ids)
-                ).order_by('-id').first()
-                
-                if new_envi_data:
-                    # 建立EnviData和EnviFile的关联
-                    new_envi_data.envi_file = envi_file
-                    new_envi_data.save()
-                    logger.info(f"成功关联 EnviData(ID:{new_envi_data.id}) 和 EnviFile(ID:{envi_file.id})")
-                    return {
-                        'status': 'success',
-                        'message': '处理完成',
-                        'envi_data_id': new_envi_data.id
-                    }
-                else:
+                # 建立EnviData和EnviFile的关联
+                # update()不会触发auto_now和模型信号，手动刷新更新时间并使GeoJSON缓存失效
+                if not EnviData.objects.filter(pk=envi_data_id).update(
+                    envi_file=envi_file, updated_at=timezone.now()
+                ):
                     raise Exception('处理完成但未找到对应的EnviData记录')
+                EnviFile.objects.filter(pk=envi_file.pk).update(status=EnviFile.STATUS_READY)
+            invalidate_geojson_cache()
+            logger.info(f"成功关联 EnviData(ID:{envi_data_id}) 和 EnviFile(ID:{envi_file.id})")
+            return {
+                'status': 'success',
+                'message': '处理完成',
+                'envi_data_id': envi_data_id
+            }
 
         except Exception as e:
             logger.error(f"处理文件失败: {str(e)}", exc_info=True)
+            EnviFile.objects.filter(pk=envi_file.pk).update(status=EnviFile.STATUS_FAILED)
             return {
                 'status': 'error',
                 'message': str(e)
             }
 
+    @staticmethod
+    def _process_in_thread(envi_file):
+        """在工作线程中处理单个文件，结束后关闭该线程的数据库连接"""
+        try:
+            return EnviProcessor.process_single_file(envi_file)
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def _process_by_id(envi_file_id):
+        """在后台线程中按ID重新读取记录并处理"""
+        try:
+            envi_file = EnviFile.objects.get(pk=envi_file_id)
+        except EnviFile.DoesNotExist:
+            logger.warning(f"待处理的文件记录不存在: ID{envi_file_id}")
+            connections.close_all()
+            return None
+        return EnviProcessor._process_in_thread(envi_file)
+
+    @staticmethod
+    def submit(envi_file_id):
+        """提交单个ENVI文件到后台线程池处理
+
+        应在保存EnviFile的事务提交后调用（如通过transaction.on_commit），
+        后台线程才能读取到记录。处理结果写入EnviFile.status。
+
+        Args:
+            envi_file_id: 待处理的EnviFile记录ID
+
+        Returns:
+            Future: 后台处理任务
+        """
+        return _background_executor.submit(EnviProcessor._process_by_id, envi_file_id)
+
     @staticmethod
     def process_files(file_pairs):
         """批量处理ENVI文件对
@@ -83,43 +225,53 @@ class EnviProcessor:
                 - status: 处理状态
                 - message: 处理消息
         """
-        results = []
+        results = {}
+        prepared = []
         
+        # 第一步：串行保存文件并创建EnviFile记录（事务在并发处理前提交，工作线程才能读取到记录）
         for base_name, files in file_pairs.items():
             # 检查文件对是否完整
             if not files['hdr'] or not files['img']:
                 logger.warning(f"文件不完整: {base_name}")
-                results.append({
+                results[base_name] = {
                     'name': base_name,
                     'status': 'error',
                     'message': '文件不完整'
-                })
+                }
                 continue
 
             try:
-                # 使用事务处理每个文件对
                 with transaction.atomic():
                     # 创建EnviFile记录
                     envi_file = EnviFile(
                         name=base_name,
-                        description=f"批量上传 - {base_name}"
+                        description=f"批量上传 - {base_name}",
+                        status=EnviFile.STATUS_PENDING
                     )
                     envi_file.hdr_file = files['hdr']
                     envi_file.img_file = files['img']
                     envi_file.save()
-                    
-                    # 处理文件
-                    process_result = EnviProcessor.process_single_file(envi_file)
-                    process_result['name'] = base_name
-                    results.append(process_result)
+                prepared.append((base_name, envi_file))
                     
             except Exception as e:
                 logger.error(f"处理文件对 {base_name} 时出错: {str(e)}", exc_info=True)
-                results.append({
+                results[base_name] = {
                     'name': base_name,
                     'status': 'error',
                     'message': str(e)
-                })
-                continue
+                }
+
+        # 第二步：并发处理文件（GDAL读写和瓦片生成以I/O为主）
+        if prepared:
+            with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(prepared))) as executor:
+                futures = {
+                    base_name: executor.submit(EnviProcessor._process_in_thread, envi_file)
+                    for base_name, envi_file in prepared
+                }
+                for base_name, future in futures.items():
+                    process_result = future.result()
+                    process_result['name'] = base_name
+                    results[base_name] = process_result
         
-        return results
\ No newline at end of file
+        # 按上传顺序返回结果
+        return [results[base_name] for base_name in file_pairs if base_name in results]
@@ -10,29 +10,40 @@
 """
 
 from django.core.files.storage import FileSystemStorage
-from django.shortcuts import redirect, render, get_object_or_404
-from django.core.management import call_command
-from django.http import JsonResponse, FileResponse
+from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
+from django.http import JsonResponse, FileResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from django.contrib.gis.db import models
 from django.views.decorators.http import require_http_methods
 from django.db import transaction
-from .models import EnviData, EnviFile, WorkStation, WorkStationFile
+from .models import EnviData, EnviFile, WorkStation, WorkStationFile, ready_envi_data
 import logging
 import os
 import json
 from django.contrib.gis.geos import GEOSGeometry
-from datetime import datetime
-from django.db.models import Q
-from .utils import EnviProcessor
+from django.contrib.gis.db.models.functions import AsGeoJSON
+from datetime import date
+from django.db.models import F, Q
+from .utils import EnviProcessor, envi_data_geojson_cached, json_dumps, json_loads
 from django.contrib.auth.decorators import login_required
 import zipfile
-import tempfile
-import shutil
 from django.conf import settings
+from osgeo import gdal
+import uuid
+from collections import defaultdict
+from itertools import chain, islice
+from django.core.paginator import Paginator
+from urllib.parse import quote
 
 # 配置日志记录器
 logger = logging.getLogger(__name__)
 
+# Web墨卡托投影半周长（米）
+WEB_MERCATOR_HALF = 20037508.342789244
+
 @login_required
 def map_view(request):
     """
@@ -44,7 +55,7 @@ def map_view(request):
     - 测量距离和面积
     - 下载数据等操作
     """
-    envi_data = EnviData.objects.all()
+    envi_data = ready_envi_data()
     return render(request, 'geodata/map.html', {'envi_data': envi_data})
 
 @login_required
@@ -58,9 +69,35 @@ def file_list_view(request):
     - Ratio方法蚀变数据
     用户可以按卫星类型筛选和下载文件。
     """
-    envi_files = EnviFile.objects.select_related('envi_data').all().order_by('-upload_date')
+    envi_files = EnviFile.objects.select_related('envi_data').filter(
+        status=EnviFile.STATUS_READY
+    ).order_by('-upload_date')
     return render(request, 'geodata/file_list.html', {'envi_files': envi_files})
 
+def _file_download_response(file_path, filename):
+    """
+    构建文件下载响应
+
+    配置了GEODATA_SENDFILE时只返回内部重定向头，由前端服务器以零拷贝方式发送文件，
+    Django工作进程立即释放；否则由FileResponse直接返回文件。
+
+    Args:
+        file_path: 文件的绝对路径
+        filename: 下载时显示的文件名
+    """
+    mode = settings.GEODATA_SENDFILE
+    if mode == 'nginx':
+        rel_path = os.path.relpath(file_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response = HttpResponse(content_type='application/octet-stream')
+        response['X-Accel-Redirect'] = quote(settings.SENDFILE_INTERNAL_URL + rel_path)
+    elif mode == 'apache':
+        response = HttpResponse(content_type='application/octet-stream')
+        response['X-Sendfile'] = file_path
+    else:
+        response = FileResponse(open(file_path, 'rb'), content_type='application/octet-stream')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @login_required
 @require_http_methods(["GET"])
 def download_file(request, file_id):
@@ -114,27 +151,24 @@ def download_file(request, file_id):
             file_path = envi_file.img_file.path
             filename = os.path.basename(envi_file.img_file.name)
     
-    # 增加下载计数
-    envi_file.download_count += 1
-    envi_file.save()
+    # 增加下载计数（单条UPDATE，计数在数据库端自增）
+    EnviFile.objects.filter(pk=envi_file.pk).update(download_count=F('download_count') + 1)
     
-    response = FileResponse(open(file_path, 'rb'), content_type='application/octet-stream')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
+    return _file_download_response(file_path, filename)
 
 @login_required
-@transaction.atomic
 def process_envi(request):
     """
     处理ENVI文件上传和处理
     
     处理单个ENVI文件的上传，包括：
     - 文件上传和保存
-    - 调用处理命令生成瓦片
-    - 创建数据记录
-    - 错误处理和回滚
+    - 提交后台任务生成瓦片、创建数据记录
+    - 错误处理
     
-    使用数据库事务确保数据一致性。
+    请求内只保存文件和EnviFile记录，耗时的GDAL处理在事务提交后交由后台线程执行，
+    返回202和状态查询地址，前端轮询处理状态。
+    上传页面通过AJAX提交，POST请求的错误同样以JSON返回（400/500），由页面显示错误信息。
     """
     if request.method == 'POST':
         try:
@@ -144,52 +178,116 @@ def process_envi(request):
             
             if not hdr_file or not img_file:
                 logger.warning('文件上传不完整')
-                return render(request, 'geodata/upload.html', {'error': '请同时上传HDR和IMG文件'})
+                return JsonResponse({'error': '请同时上传HDR和IMG文件'}, status=400)
 
-            # 开启数据库事务
+            # 开启数据库事务，只包含文件保存和记录创建
             with transaction.atomic():
-                # 创建EnviFile记录
+                # 创建EnviFile记录，处理完成前状态为"处理中"
                 envi_file = EnviFile(
                     description=description,
                     hdr_file=hdr_file,
-                    img_file=img_file
+                    img_file=img_file,
+                    status=EnviFile.STATUS_PENDING
                 )
                 envi_file.save()
                 
-                try:
-                    # 处理文件并生成瓦片
-                    call_command('process_envi', envi_file.hdr_file.path, envi_file.img_file.path)
-                    logger.info(f'ENVI处理成功: {envi_file.name}')
-                    
-                    # 获取最新创建的EnviData记录并关联
-                    try:
-                        latest_envi_data = EnviData.objects.latest('id')
-                        if not latest_envi_data.envi_file:  # 确保这是刚创建的记录
-                            latest_envi_data.envi_file = envi_file
-                            latest_envi_data.save()
-                            logger.info(f'成功关联EnviData(ID:{latest_envi_data.id})和EnviFile(ID:{envi_file.id})')
-                        else:
-                            # 如果最新记录已经有关联文件，可能是处理出错
-                            raise Exception('无法找到对应的EnviData记录')
-                    except EnviData.DoesNotExist:
-                        # 如果没有找到EnviData记录，清理已上传的文件
-                        raise Exception('处理完成但未创建EnviData记录')
-                    
-                    return redirect('geodata:map')
-                except Exception as e:
-                    # 如果处理过程出错，回滚事务（这会自动删除已创建的EnviFile记录）
-                    logger.error(f'数据处理失败: {str(e)}', exc_info=True)
-                    transaction.set_rollback(True)
-                    return render(request, 'geodata/upload.html', {'error': f'数据处理失败: {str(e)}'})
+                # 事务提交后再提交后台任务，保证后台线程能读取到记录
+                envi_file_id = envi_file.pk
+                transaction.on_commit(lambda: EnviProcessor.submit(envi_file_id))
+
+            logger.info(f'ENVI文件已上传，等待后台处理: {envi_file.name} (ID: {envi_file_id})')
+            return JsonResponse({
+                'status': envi_file.status,
+                'file_id': envi_file_id,
+                'status_url': reverse('geodata:envi_file_status', args=[envi_file_id])
+            }, status=202)
         except Exception as e:
             logger.critical(f'系统错误: {str(e)}', exc_info=True)
-            return render(request, 'geodata/upload.html', {'error': '系统发生意外错误'})
+            return JsonResponse({'error': '系统发生意外错误'}, status=500)
     
     return render(request, 'geodata/upload.html')
 
+@login_required
+@require_http_methods(["GET"])
+def envi_file_status(request, file_id):
+    """
+    查询ENVI文件的后台处理状态
+
+    Returns:
+        JsonResponse: 包含处理状态（pending/ready/failed）和文件ID
+    """
+    status = EnviFile.objects.filter(pk=file_id).values_list('status', flat=True).first()
+    if status is None:
+        raise Http404('文件不存在')
+    return JsonResponse({'status': status, 'file_id': file_id})
+
 from django.contrib.gis.db.models.functions import Transform
 
 @login_required
+@require_http_methods(["GET"])
+@cache_control(private=True, max_age=86400)
+def envi_tile(request, basename, z, x, y):
+    """
+    动态瓦片接口
+    
+    从入库时生成的Cloud-Optimized GeoTIFF中读取XYZ瓦片范围内的数据，
+    渲染为256x256的PNG返回。GDAL按缩放级别自动选择概览层，只读取相交的数据块。
+    瓦片URL带有数据源版本参数（v），重新入库后URL改变，因此可以长时间缓存。
+    
+    Args:
+        basename: 影像基础文件名
+        z, x, y: XYZ瓦片坐标
+    """
+    cog_path = os.path.join(settings.TILE_COG_DIR, f'{basename}.tif')
+    if not os.path.exists(cog_path) or z < 0 or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise Http404('瓦片不存在')
+
+    # 计算瓦片的Web墨卡托范围
+    span = 2 * WEB_MERCATOR_HALF / (1 << z)
+    min_x = -WEB_MERCATOR_HALF + x * span
+    max_y = WEB_MERCATOR_HALF - y * span
+    png_path = f'/vsimem/tile_{uuid.uuid4().hex}.png'
+
+    try:
+        warped = gdal.Warp(
+            '', cog_path,
+            format='MEM',
+            dstSRS='EPSG:3857',
+            outputBounds=(min_x, max_y - span, min_x + span, max_y),
+            width=256, height=256,
+            resampleAlg='bilinear',
+            dstAlpha=True  # 无数据区域透明
+        )
+        # Web进程中未启用GDAL异常时，失败只返回None而不抛出异常
+        if warped is None:
+            logger.error(f'瓦片重投影失败 {basename}/{z}/{x}/{y}: {gdal.GetLastErrorMsg()}')
+            return HttpResponse(status=500)
+        png = gdal.Translate(png_path, warped, format='PNG')
+        warped = None
+        if png is None:
+            logger.error(f'瓦片PNG编码失败 {basename}/{z}/{x}/{y}: {gdal.GetLastErrorMsg()}')
+            return HttpResponse(status=500)
+        png = None  # 关闭数据集，确保PNG写入内存文件
+
+        # 从内存文件读取PNG数据
+        f = gdal.VSIFOpenL(png_path, 'rb')
+        try:
+            size = gdal.VSIStatL(png_path).size
+            data = gdal.VSIFReadL(1, size, f)
+        finally:
+            gdal.VSIFCloseL(f)
+    except Exception as e:
+        logger.error(f'瓦片渲染失败 {basename}/{z}/{x}/{y}: {str(e)}')
+        return HttpResponse(status=500)
+    finally:
+        if gdal.VSIStatL(png_path):
+            gdal.Unlink(png_path)
+
+    return HttpResponse(data, content_type='image/png')
+
+
+@login_required
+@cache_control(private=True, no_cache=True)  # 每次向服务器确认，数据未变时返回304
 def envi_data_api(request):
     """
     获取所有遥感数据的API端点
@@ -203,39 +301,74 @@ def envi_data_api(request):
     用于在地图上显示影像范围和属性信息。
     """
     try:
-        envi_data = EnviData.objects.all()
-        features = []
-        
-        for data in envi_data:
-            try:
-                geometry = json.loads(data.bounds.geojson) if data.bounds else None
-                features.append({
-                    "type": "Feature",
-                    "geometry": geometry,
-                    "properties": {
-                        "name": data.name,
-                        'sensor_type': data.sensor_type,
-                        "resolution": data.resolution,
-                        "acquisition_date": data.acquisition_date.strftime('%Y-%m-%d'),
-                        "tile_url": data.tile_url,
-                        "file_id": data.envi_file.id if data.envi_file else None,
-                        "coordinate_system": data.coordinate_system,
-                        "wavelength_info": data.wavelength_info
-                    }
-                })
-            except Exception as e:
-                logger.error(f'要素序列化失败 ID{data.id}: {str(e)}')
-                continue
+        payload, payload_gz, version, updated = envi_data_geojson_cached()
+        etag = f'"{version}"'
+        last_modified = int(updated.timestamp()) if updated else None
 
-        return JsonResponse({
-            "type": "FeatureCollection",
-            "features": features
-        }, safe=False)
+        # 数据未变化时返回304，浏览器复用已缓存的响应
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            # 客户端支持gzip时直接返回预先压缩的结果
+            if 'gzip' in request.headers.get('Accept-Encoding', ''):
+                response = HttpResponse(payload_gz, content_type='application/json')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = HttpResponse(payload, content_type='application/json')
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
     
     except Exception as e:
         logger.exception("API请求失败: %s", e)
         return JsonResponse({'error': '数据处理失败，请稍后重试'}, status=500)
 
+def _swap_xy(coords):
+    """递归交换GeoJSON坐标数组中每个点的x、y顺序"""
+    if coords and isinstance(coords[0], (int, float)):
+        return [coords[1], coords[0], *coords[2:]]
+    return [_swap_xy(c) for c in coords]
+
+# 流式输出查询结果时每次从数据库读取的记录数
+QUERY_CHUNK_SIZE = 500
+
+def _iter_spatial_results(records, log_info):
+    """
+    逐条生成空间查询结果的JSON内容
+
+    单条记录序列化失败时直接抛出异常，不跳过记录，避免静默返回不完整的结果。
+
+    Args:
+        records: 可迭代的EnviData记录（已应用过滤条件）
+        log_info: 是否输出INFO级别的逐条日志
+    """
+    yield b'{"results": ['
+    count = 0
+    for envi_data in records:
+        result = {
+            'id': envi_data.id,
+            'name': envi_data.name,
+            'sensor_type': envi_data.sensor_type,
+            'acquisition_date': envi_data.acquisition_date.strftime('%Y-%m-%d'),
+            'resolution': envi_data.resolution,
+            'coordinate_system': envi_data.coordinate_system,
+            'wavelength_info': envi_data.wavelength_info,
+            'size': envi_data.envi_file.file_size if envi_data.envi_file else 0,
+            'has_pc_alteration': bool(envi_data.envi_file and envi_data.envi_file.pc_hdr_file),
+            'has_ratio_alteration': bool(envi_data.envi_file and envi_data.envi_file.ratio_hdr_file)
+        }
+        chunk = json_dumps(result)
+        if envi_data.bounds_geojson:
+            # 将已序列化的几何直接拼接到结果对象末尾
+            chunk = chunk[:-1] + b', "bounds": ' + envi_data.bounds_geojson.encode() + b'}'
+        yield chunk if count == 0 else b', ' + chunk
+        count += 1
+        if log_info:
+            logger.info(f"添加结果: {result['name']} ({result['sensor_type']})")
+    yield b']}'
+    logger.info(f"最终返回结果数量: {count}")
+
 @login_required
 @require_http_methods(["POST"])
 def spatial_query(request):
@@ -257,43 +390,52 @@ def spatial_query(request):
     返回满足条件的遥感数据列表，包含详细的属性信息。
     """
     try:
-        data = json.loads(request.body)
-        logger.info(f"接收到空间查询请求: {json.dumps(data, indent=2)}")
+        data = json_loads(request.body)
+        # 日志内容的格式化只在对应级别启用时进行
+        log_info = logger.isEnabledFor(logging.INFO)
+        if log_info:
+            logger.info(f"接收到空间查询请求: {json.dumps(data, indent=2)}")
         
         geometry = data.get('geometry')
         start_date = data.get('startDate')
         end_date = data.get('endDate')
         sensor_types = data.get('sensorTypes', [])
         
-        logger.info(f"查询参数: 开始日期={start_date}, 结束日期={end_date}, 卫星类型={sensor_types}")
+        logger.info("查询参数: 开始日期=%s, 结束日期=%s, 卫星类型=%s", start_date, end_date, sensor_types)
         
-        # 获取数据库中的所有记录数
-        total_records = EnviData.objects.count()
-        logger.info(f"数据库中的总记录数: {total_records}")
+        # 获取数据库中的所有记录数（额外的COUNT查询，仅在DEBUG级别统计）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"数据库中的总记录数: {EnviData.objects.count()}")
         
-        # 构建查询
-        query = EnviData.objects.all()
+        # 构建查询（QuerySet惰性求值，各过滤条件最终合并为一条SELECT）
+        # 边界由数据库直接输出为GeoJSON字符串，不再加载为GEOS对象；
+        # 关联的ENVI文件通过JOIN一并取出，只读取结果中用到的字段
+        query = ready_envi_data().select_related('envi_file').only(
+            'id', 'name', 'sensor_type', 'acquisition_date', 'resolution',
+            'coordinate_system', 'wavelength_info', 'envi_file',
+            'envi_file__img_file', 'envi_file__pc_hdr_file', 'envi_file__ratio_hdr_file'
+        ).annotate(bounds_geojson=AsGeoJSON('bounds'))
         
         # 应用卫星类型过滤
         if sensor_types:
             query = query.filter(sensor_type__in=sensor_types)
-            logger.info(f"应用卫星类型过滤 {sensor_types}, 剩余记录数: {query.count()}")
+            logger.info("应用卫星类型过滤 %s", sensor_types)
         
         # 处理日期范围过滤
         if start_date:
             try:
-                start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+                start_date = date.fromisoformat(start_date)
                 query = query.filter(acquisition_date__gte=start_date)
-                logger.info(f"应用开始日期过滤 {start_date}, 剩余记录数: {query.count()}")
+                logger.info("应用开始日期过滤 %s", start_date)
             except ValueError as e:
                 logger.error(f"开始日期格式错误: {e}")
                 return JsonResponse({'error': '开始日期格式错误'}, status=400)
         
         if end_date:
             try:
-                end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+                end_date = date.fromisoformat(end_date)
                 query = query.filter(acquisition_date__lte=end_date)
-                logger.info(f"应用结束日期过滤 {end_date}, 剩余记录数: {query.count()}")
+                logger.info("应用结束日期过滤 %s", end_date)
             except ValueError as e:
                 logger.error(f"结束日期格式错误: {e}")
                 return JsonResponse({'error': '结束日期格式错误'}, status=400)
@@ -303,72 +445,40 @@ def spatial_query(request):
             try:
                 # 创建搜索几何对象，设置SRID为4326（WGS84）
                 search_geometry = GEOSGeometry(json.dumps(geometry), srid=4326)
-                logger.info(f"原始搜索几何对象: {search_geometry.wkt}")
+                if log_info:
+                    logger.info(f"原始搜索几何对象: {search_geometry.wkt}")
 
                 # 如果是LineString，创建缓冲区
                 if search_geometry.geom_type == 'LineString':
                     buffer_size = 1.0  # 1度缓冲区（约111km）
                     search_geometry = search_geometry.buffer(buffer_size)
-                    logger.info(f"将LineString转换为带缓冲区的多边形: {search_geometry.wkt}")
-                
-                # 使用空间过滤
-                matching_records = []
-                for record in query:
-                    if record.bounds:
-                        try:
-                            # 交换坐标顺序（处理坐标系差异）
-                            swapped_wkt = record.bounds.wkt.replace('POLYGON ((', '').replace('))', '')
-                            coords = [coord.strip().split() for coord in swapped_wkt.split(',')]
-                            swapped_coords = [f"{y} {x}" for x, y in [coord for coord in coords]]
-                            swapped_wkt = 'POLYGON ((' + ', '.join(swapped_coords) + '))'
-                            record_bounds = GEOSGeometry(swapped_wkt, srid=4326)
-                            
-                            if search_geometry.intersects(record_bounds):
-                                matching_records.append(record.id)
-                                logger.info(f"找到匹配记录: ID={record.id}, 名称={record.name}")
-                                
-                        except Exception as e:
-                            logger.error(f"处理记录 {record.id} 时出错: {e}", exc_info=True)
-                            continue
+                    if log_info:
+                        logger.info(f"将LineString转换为带缓冲区的多边形: {search_geometry.wkt}")
                 
-                # 应用空间过滤结果
-                if matching_records:
-                    query = query.filter(id__in=matching_records)
-                    logger.info(f"空间过滤后的匹配记录数: {query.count()}")
-                else:
-                    query = EnviData.objects.none()
-                    logger.info("空间过滤后没有匹配记录")
+                # 库中边界的坐标顺序与搜索几何相反（纬度-经度），交换坐标是保持相交关系的对称变换，
+                # 因此交换搜索几何一次，即可由数据库用空间索引完成ST_Intersects过滤
+                flipped = json.loads(search_geometry.json)
+                flipped['coordinates'] = _swap_xy(flipped['coordinates'])
+                search_geometry = GEOSGeometry(json.dumps(flipped), srid=4326)
+                query = query.filter(bounds__intersects=search_geometry)
                 
             except Exception as e:
                 logger.error(f"几何对象处理错误: {e}", exc_info=True)
                 return JsonResponse({'error': f'几何对象处理错误: {str(e)}'}, status=400)
         
-        # 构建查询结果
-        results = []
-        for envi_data in query:
-            try:
-                result = {
-                    'id': envi_data.id,
-                    'name': envi_data.name,
-                    'sensor_type': envi_data.sensor_type,
-                    'acquisition_date': envi_data.acquisition_date.strftime('%Y-%m-%d'),
-                    'resolution': envi_data.resolution,
-                    'coordinate_system': envi_data.coordinate_system,
-                    'wavelength_info': envi_data.wavelength_info,
-                    'size': envi_data.envi_file.file_size if envi_data.envi_file else 0,
-                    'has_pc_alteration': bool(envi_data.envi_file and envi_data.envi_file.pc_hdr_file),
-                    'has_ratio_alteration': bool(envi_data.envi_file and envi_data.envi_file.ratio_hdr_file)
-                }
-                if envi_data.bounds:
-                    result['bounds'] = json.loads(envi_data.bounds.json)
-                results.append(result)
-                logger.info(f"添加结果: {result['name']} ({result['sensor_type']})")
-            except Exception as e:
-                logger.error(f"处理结果时出错 ID {envi_data.id}: {e}")
-                continue
-        
-        logger.info(f"最终返回结果数量: {len(results)}")
-        return JsonResponse({'results': results})
+        # 在视图内执行查询并取出第一批记录，数据库错误由下面的异常处理返回500，
+        # 而不是在响应开始输出后才出现、留下截断的JSON
+        records = query.iterator(chunk_size=QUERY_CHUNK_SIZE)
+        first = list(islice(records, QUERY_CHUNK_SIZE))
+        if len(first) < QUERY_CHUNK_SIZE:
+            # 结果不足一批时已全部取出，直接完整序列化后返回
+            return HttpResponse(
+                b''.join(_iter_spatial_results(first, log_info)), content_type='application/json'
+            )
+        # 结果较多时分块读取并逐条序列化输出，内存占用与结果数量无关
+        return StreamingHttpResponse(
+            _iter_spatial_results(chain(first, records), log_info), content_type='application/json'
+        )
         
     except Exception as e:
         logger.error(f"空间查询出错: {str(e)}", exc_info=True)
@@ -392,20 +502,42 @@ def download_image(request, image_id):
         if not envi_data.envi_file:
             return JsonResponse({'error': '文件不存在'}, status=404)
 
-        # 增加下载计数
-        envi_data.envi_file.download_count += 1
-        envi_data.envi_file.save()
+        # 增加下载计数（单条UPDATE，计数在数据库端自增）
+        EnviFile.objects.filter(pk=envi_data.envi_file_id).update(download_count=F('download_count') + 1)
 
         # 返回文件下载响应
-        response = FileResponse(open(envi_data.envi_file.img_file.path, 'rb'))
-        response['Content-Type'] = 'application/octet-stream'
-        response['Content-Disposition'] = f'attachment; filename="{envi_data.name}.img"'
-        return response
+        return _file_download_response(envi_data.envi_file.img_file.path, f'{envi_data.name}.img')
     except EnviData.DoesNotExist:
         return JsonResponse({'error': '影像不存在'}, status=404)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+def _group_file_pairs(files):
+    """
+    按基础文件名将上传文件分组为.hdr和.img文件对
+
+    Args:
+        files: 上传的文件列表
+
+    Returns:
+        tuple: (文件对字典, 错误结果列表)。文件名格式错误的文件不会中断整批上传，
+            而是以错误结果返回
+    """
+    file_pairs = defaultdict(lambda: {'hdr': None, 'img': None})
+    errors = []
+    for file in files:
+        base_name, _, ext = file.name.rpartition('.')
+        ext = ext.lower()
+        if not base_name or ext not in ('hdr', 'img'):
+            errors.append({
+                'name': file.name,
+                'status': 'error',
+                'message': f'文件名格式错误: {file.name}'
+            })
+            continue
+        file_pairs[base_name][ext] = file
+    return file_pairs, errors
+
 @login_required
 @require_http_methods(['GET', 'POST'])
 def batch_upload(request):
@@ -432,30 +564,11 @@ def batch_upload(request):
                     'error': '没有接收到文件'
                 })
 
-            # 用于临时存储文件对
-            file_pairs = {}
-            
             # 第一步：整理文件对
-            for file in files:
-                try:
-                    ext = file.name.rsplit('.', 1)[1].lower()
-                    base_name = file.name.rsplit('.', 1)[0]
-                    
-                    if base_name not in file_pairs:
-                        file_pairs[base_name] = {'hdr': None, 'img': None}
-                    
-                    if ext in ['hdr', 'img']:
-                        file_pairs[base_name][ext] = file
-
-                except Exception as e:
-                    logger.error(f"处理文件 {file.name} 时出错: {str(e)}", exc_info=True)
-                    return JsonResponse({
-                        'success': False,
-                        'error': f'文件名格式错误: {file.name}'
-                    })
+            file_pairs, errors = _group_file_pairs(files)
 
             # 第二步：使用EnviProcessor处理文件对
-            results = EnviProcessor.process_files(file_pairs)
+            results = EnviProcessor.process_files(file_pairs) + errors
             
             # 统计处理结果
             success_count = sum(1 for r in results if r['status'] == 'success')
@@ -478,6 +591,9 @@ def batch_upload(request):
     # GET请求返回上传页面
     return render(request, 'geodata/batch_upload.html')
 
+# 蚀变数据上传页面每页显示的文件数
+ALTERATION_PAGE_SIZE = 50
+
 @login_required
 @require_http_methods(['GET', 'POST'])
 def alteration_upload(request):
@@ -507,25 +623,35 @@ def alteration_upload(request):
                     'error': '请选择要上传的文件'
                 })
 
-            # 用于存储处理结果
-            results = []
+            # 按文件名分组（.hdr和.img），文件名不合法的文件直接计入处理结果
+            file_pairs, results = _group_file_pairs(files)
             success_count = 0
-            
-            # 按文件名分组（.hdr和.img）
-            file_pairs = {}
-            for file in files:
-                base_name = file.name.rsplit('.', 1)[0]
-                ext = file.name.rsplit('.', 1)[1].lower()
-                
-                if base_name not in file_pairs:
-                    file_pairs[base_name] = {'hdr': None, 'img': None}
-                
-                if ext == 'hdr':
-                    file_pairs[base_name]['hdr'] = file
-                elif ext == 'img':
-                    file_pairs[base_name]['img'] = file
 
+            # 从文件名中提取原始文件名
+            original_names = {
+                base_name: base_name.replace('_PC_alt', '').replace('_ratio_alt', '')
+                for base_name in file_pairs
+            }
+            
+            # 一次查询取出所有可能对应的原始数据记录，再在内存中按名称前缀匹配
+            candidates = []
+            if original_names:
+                prefix_filter = Q()
+                for original_name in set(original_names.values()):
+                    # 空前缀会匹配所有记录，跳过（对应文件在下面单独报错）
+                    if original_name:
+                        prefix_filter |= Q(name__startswith=original_name)
+                if prefix_filter:
+                    candidates = list(EnviFile.objects.filter(prefix_filter))
+            
+            if alteration_type == 'pc':
+                hdr_field, img_field = 'pc_hdr_file', 'pc_img_file'
+            else:  # ratio
+                hdr_field, img_field = 'ratio_hdr_file', 'ratio_img_file'
+            
             # 处理每对文件
+            changed = {}
+            stored = []  # 已写入存储的文件，数据库更新失败时删除
             for base_name, pair in file_pairs.items():
                 try:
                     if not pair['hdr'] or not pair['img']:
@@ -536,35 +662,39 @@ def alteration_upload(request):
                         })
                         continue
 
-                    # 从文件名中提取原始文件名
-                    original_name = base_name.replace('_PC_alt', '').replace('_ratio_alt', '')
-                    
                     # 查找对应的原始数据记录
-                    try:
-                        original_file = EnviFile.objects.get(name__startswith=original_name)
-                        
-                        # 根据蚀变类型更新对应的字段
-                        if alteration_type == 'pc':
-                            original_file.pc_hdr_file = pair['hdr']
-                            original_file.pc_img_file = pair['img']
-                        else:  # ratio
-                            original_file.ratio_hdr_file = pair['hdr']
-                            original_file.ratio_img_file = pair['img']
-
-                        original_file.save()
-                        success_count += 1
+                    original_name = original_names[base_name]
+                    if not original_name:
                         results.append({
                             'name': base_name,
-                            'status': 'success',
-                            'message': '上传成功'
+                            'status': 'error',
+                            'message': '无法从文件名中识别原始数据名称'
                         })
-                        
-                    except EnviFile.DoesNotExist:
+                        continue
+                    matches = [f for f in candidates if f.name.startswith(original_name)]
+                    if not matches:
                         results.append({
                             'name': base_name,
                             'status': 'error',
                             'message': f'未找到对应的原始数据文件：{original_name}'
                         })
+                        continue
+                    if len(matches) > 1:
+                        raise Exception(f'找到多个对应的原始数据文件：{original_name}')
+                    original_file = matches[0]
+                    
+                    # 根据蚀变类型保存文件，数据库记录最后批量更新
+                    for field_name, upload in ((hdr_field, pair['hdr']), (img_field, pair['img'])):
+                        field_file = getattr(original_file, field_name)
+                        field_file.save(upload.name, upload, save=False)
+                        stored.append((field_file.storage, field_file.name))
+                    changed[original_file.pk] = original_file
+                    success_count += 1
+                    results.append({
+                        'name': base_name,
+                        'status': 'success',
+                        'message': '上传成功'
+                    })
                         
                 except Exception as e:
                     logger.error(f"处理文件 {base_name} 时出错: {str(e)}", exc_info=True)
@@ -574,6 +704,19 @@ def alteration_upload(request):
                         'message': str(e)
                     })
 
+            if changed:
+                try:
+                    with transaction.atomic():
+                        EnviFile.objects.bulk_update(changed.values(), [hdr_field, img_field])
+                except Exception:
+                    # 数据库未更新，删除已写入的文件，避免留下无记录引用的文件
+                    for storage, name in stored:
+                        try:
+                            storage.delete(name)
+                        except OSError as e:
+                            logger.warning(f"文件清理失败 {name}: {str(e)}")
+                    raise
+
             return JsonResponse({
                 'success': True,
                 'message': f'已完成 {len(results)} 个文件的处理，其中 {success_count} 个成功',
@@ -587,10 +730,13 @@ def alteration_upload(request):
                 'error': f'上传失败: {str(e)}'
             })
     
-    # GET请求显示上传页面
-    return render(request, 'geodata/alteration_upload.html', {
-        'envi_files': EnviFile.objects.all().order_by('-upload_date')
-    })
+    # GET请求显示上传页面（已上传数据列表分页显示，只读取列表所需的字段）
+    envi_files = EnviFile.objects.only(
+        'id', 'name', 'upload_date',
+        'pc_hdr_file', 'pc_img_file', 'ratio_hdr_file', 'ratio_img_file'
+    ).order_by('-upload_date')
+    page_obj = Paginator(envi_files, ALTERATION_PAGE_SIZE).get_page(request.GET.get('page'))
+    return render(request, 'geodata/alteration_upload.html', {'page_obj': page_obj})
 
 @login_required
 def workstation_list(request):
@@ -623,7 +769,11 @@ def workstation_detail(request, pk):
         pk: 工作站的主键ID
     """
     workstation = get_object_or_404(WorkStation, pk=pk, user=request.user)
-    files = WorkStationFile.objects.filter(workstation=workstation)
+    # 一并JOIN取出文件及其遥感数据记录，模板中逐行访问时无需额外查询
+    # 后台处理中或处理失败的文件不显示
+    files = WorkStationFile.objects.filter(
+        workstation=workstation, envi_file__status=EnviFile.STATUS_READY
+    ).select_related('envi_file__envi_data')
     return render(request, 'geodata/workstation_detail.html', {
         'workstation': workstation,
         'files': files
@@ -645,7 +795,7 @@ def create_workstation(request):
     
     返回新创建的工作站信息。
     """
-    data = json.loads(request.body)
+    data = json_loads(request.body)
     name = data.get('name')
     description = data.get('description', '')
     
@@ -681,7 +831,7 @@ def add_to_workstation(request):
     
     返回添加结果，包括成功添加的文件数量。
     """
-    data = json.loads(request.body)
+    data = json_loads(request.body)
     workstation_id = data.get('workstation_id')
     file_ids = data.get('file_ids', [])
     
@@ -690,17 +840,15 @@ def add_to_workstation(request):
     
     workstation = get_object_or_404(WorkStation, pk=workstation_id, user=request.user)
     
-    added_files = []
-    for file_id in file_ids:
-        try:
-            envi_file = EnviFile.objects.get(pk=file_id)
-            WorkStationFile.objects.get_or_create(
-                workstation=workstation,
-                envi_file=envi_file
-            )
-            added_files.append(file_id)
-        except Exception as e:
-            continue
+    # 一次查询确认存在的文件，再一次批量插入（已存在的关联由唯一约束忽略）
+    valid_ids = set(EnviFile.objects.filter(
+        pk__in=[fid for fid in file_ids if str(fid).isdigit()]
+    ).values_list('pk', flat=True))
+    WorkStationFile.objects.bulk_create(
+        [WorkStationFile(workstation=workstation, envi_file_id=fid) for fid in valid_ids],
+        ignore_conflicts=True
+    )
+    added_files = [fid for fid in file_ids if str(fid).isdigit() and int(fid) in valid_ids]
     
     return JsonResponse({
         'message': f'成功添加 {len(added_files)} 个文件到工作站',
@@ -723,7 +871,7 @@ def remove_from_workstation(request):
     
     返回移除结果。
     """
-    data = json.loads(request.body)
+    data = json_loads(request.body)
     workstation_id = data.get('workstation_id')
     file_ids = data.get('file_ids', [])
     
@@ -742,6 +890,59 @@ def remove_from_workstation(request):
         'removed_files': file_ids
     })
 
+# 流式ZIP每次读取源文件的块大小（字节）
+ZIP_CHUNK_SIZE = 1 << 20
+
+class _ZipStreamBuffer:
+    """ZipFile的只写输出缓冲，写入的数据由生成器逐块取走"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        """取出并清空已写入的数据"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _iter_zip(entries):
+    """
+    逐块生成ZIP文件内容
+
+    Args:
+        entries: (源文件路径, 压缩包内文件名) 列表
+    """
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for path, arcname in entries:
+            try:
+                # 按源文件构建条目信息，保留文件的修改时间和权限
+                zinfo = zipfile.ZipInfo.from_file(path, arcname)
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                src = open(path, 'rb')
+            except OSError as e:
+                logger.error(f"添加文件 {arcname} 到ZIP时出错: {str(e)}")
+                continue
+            with src, zipf.open(zinfo, 'w', force_zip64=True) as dst:
+                while True:
+                    chunk = src.read(ZIP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            yield buffer.pop()
+    # 写出中央目录
+    yield buffer.pop()
+
 @login_required
 @require_http_methods(["POST"])
 def batch_download(request):
@@ -750,8 +951,7 @@ def batch_download(request):
     
     将选中的文件打包下载，支持：
     - 多文件打包下载
-    - 自动创建临时ZIP文件
-    - 下载完成后自动清理临时文件
+    - 边压缩边输出，不生成临时ZIP文件
     - 更新文件下载计数
     
     POST请求参数：
@@ -768,78 +968,33 @@ def batch_download(request):
             return JsonResponse({'error': '参数错误'}, status=400)
         
         workstation = get_object_or_404(WorkStation, pk=workstation_id, user=request.user)
-        
-        # 创建临时目录
-        temp_dir = tempfile.mkdtemp()
         zip_filename = f'workstation_{workstation.id}_files.zip'
-        zip_path = os.path.join(temp_dir, zip_filename)
         
-        try:
-            # 创建ZIP文件
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for file_id in file_ids:
-                    try:
-                        envi_file = EnviFile.objects.get(pk=file_id)
-                        
-                        # 添加HDR文件
-                        if envi_file.hdr_file:
-                            hdr_name = os.path.basename(envi_file.hdr_file.name)
-                            zipf.write(envi_file.hdr_file.path, hdr_name)
-                        
-                        # 添加IMG文件
-                        if envi_file.img_file:
-                            img_name = os.path.basename(envi_file.img_file.name)
-                            zipf.write(envi_file.img_file.path, img_name)
-                        
-                        # 增加下载计数
-                        envi_file.download_count += 1
-                        envi_file.save()
-                        
-                    except Exception as e:
-                        logger.error(f"添加文件 {file_id} 到ZIP时出错: {str(e)}")
-                        continue
-            
-            # 打开文件并创建响应
-            if os.path.exists(zip_path):
-                response = FileResponse(
-                    open(zip_path, 'rb'),
-                    content_type='application/zip',
-                    as_attachment=True,
-                    filename=zip_filename
-                )
-                
-                # 注册一个回调来清理临时文件
-                response._resource_closers.append(lambda: cleanup_temp_files(temp_dir))
-                
-                return response
-            else:
-                raise Exception("ZIP文件创建失败")
-                
-        except Exception as e:
-            # 如果在处理过程中出现错误，清理临时文件并返回错误响应
-            cleanup_temp_files(temp_dir)
-            logger.error(f"创建ZIP文件时出错: {str(e)}")
-            return JsonResponse({'error': '创建下载文件失败'}, status=500)
+        # 一次查询取出所有选中的文件
+        envi_files = list(EnviFile.objects.filter(pk__in=[i for i in file_ids if i.isdigit()]))
+        
+        entries = []
+        for envi_file in envi_files:
+            for field in (envi_file.hdr_file, envi_file.img_file):
+                if field:
+                    entries.append((field.path, os.path.basename(field.name)))
+        if not entries:
+            return JsonResponse({'error': '未找到选中的文件'}, status=404)
+        
+        # 增加下载计数（单条UPDATE，计数在数据库端自增）
+        EnviFile.objects.filter(pk__in=[f.pk for f in envi_files]).update(
+            download_count=F('download_count') + 1
+        )
+        
+        # 边压缩边输出，不在磁盘上生成临时ZIP文件
+        response = StreamingHttpResponse(_iter_zip(entries), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{zip_filename}"'
+        return response
             
     except Exception as e:
         logger.error(f"批量下载处理失败: {str(e)}")
         return JsonResponse({'error': '下载处理失败'}, status=500)
 
-def cleanup_temp_files(temp_dir):
-    """
-    清理临时文件
-    
-    删除批量下载过程中创建的临时文件和目录。
-    
-    Args:
-        temp_dir: 临时目录的路径
-    """
-    try:
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-    except Exception as e:
-        logger.error(f"清理临时文件失败: {str(e)}")
-
 @login_required
 @require_http_methods(["POST"])
 def save_file_note(request):
@@ -856,7 +1011,7 @@ def save_file_note(request):
     返回更新后的备注信息。
     """
     try:
-        data = json.loads(request.body)
+        data = json_loads(request.body)
         workstation_id = data.get('workstation_id')
         file_id = data.get('file_id')
         note = data.get('note', '')
@@ -904,7 +1059,18 @@ def image_info(request, image_id):
     返回JSON格式的影像信息。
     """
     try:
-        envi_data = get_object_or_404(EnviData, id=image_id)
+        envi_data = get_object_or_404(
+            ready_envi_data().defer('bounds').annotate(bounds_geojson=AsGeoJSON('bounds')),
+            id=image_id
+        )
+        
+        # 记录未更新时返回304
+        last_modified = int(envi_data.updated_at.timestamp())
+        etag = f'"{envi_data.id}-{last_modified}"'
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            response['ETag'] = etag
+            return response
         
         # 构建响应数据
         response_data = {
@@ -915,11 +1081,18 @@ def image_info(request, image_id):
             'acquisition_date': envi_data.acquisition_date.strftime('%Y-%m-%d'),
             'coordinate_system': envi_data.coordinate_system,
             'wavelength_info': envi_data.wavelength_info,
-            'tile_url': envi_data.tile_url,
-            'geometry': json.loads(envi_data.bounds.json) if envi_data.bounds else None
+            'tile_url': envi_data.tile_url
         }
         
-        return JsonResponse(response_data)
+        # 几何由数据库输出为GeoJSON字符串，直接拼接到响应末尾
+        geometry = (envi_data.bounds_geojson or 'null').encode()
+        response = HttpResponse(
+            json_dumps(response_data)[:-1] + b', "geometry": ' + geometry + b'}',
+            content_type='application/json'
+        )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
     except Exception as e:
         logger.error(f"获取影像信息失败 ID {image_id}: {str(e)}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)